@@ -0,0 +1,98 @@
+"""Measures event loop lag while parsing pages inline and in a ParserPool
+
+Usage: python benchmarks/parsing_lag.py [pages]
+
+Parses a synthetic news feed, and a synthetic wiki search page if
+BeautifulSoup is installed, first directly on the loop as the cog used
+to and then through thread and process pools.
+"""
+import asyncio
+import os
+import sys
+import time
+import xml.etree.ElementTree as et
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cogs.utils.loopmonitor import LoopMonitor
+from cogs.utils.parsing import ParserPool
+
+try:
+    from bs4 import BeautifulSoup
+    soupAvailable = True
+except:
+    soupAvailable = False
+
+
+def make_feed(items=400):
+    entries = "".join(
+        "<item><title>News {0}</title><link>https://example.com/{0}</link>"
+        "<guid>https://example.com/?p={0}</guid><description>&lt;p&gt;"
+        "{1}&lt;/p&gt;</description></item>".format(i, "lorem ipsum " * 40)
+        for i in range(items))
+    return ("<?xml version=\"1.0\"?><rss><channel><title>Feed</title>{}"
+            "</channel></rss>".format(entries)).encode("utf-8")
+
+
+def make_search_page(results=300):
+    entries = "".join(
+        "<li><div class=\"mw-search-result-heading\"><a href=\"/wiki/{0}\">"
+        "Page {0}</a></div><div class=\"searchresult\">{1}</div></li>".format(
+            i, "some <b>matched</b> text " * 20)
+        for i in range(results))
+    return "<html><body><ul>{}</ul></body></html>".format(entries)
+
+
+def parse_feed(data):
+    items = []
+    for _, elem in et.iterparse(BytesIO(data)):
+        if elem.tag == "item":
+            items.append(elem.findtext("title"))
+            elem.clear()
+    return items
+
+
+def parse_search(html):
+    soup = BeautifulSoup(html, "html.parser")
+    div = soup.find("div", {"class": "mw-search-result-heading"})
+    return div.find("a")["href"]
+
+
+async def measure(loop, label, jobs, pool=None):
+    monitor = LoopMonitor(loop, interval=0.005, threshold=3600)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    start = time.monotonic()
+    for func, arg in jobs:
+        if pool is None:
+            func(arg)
+            await asyncio.sleep(0)
+        else:
+            await pool.run(func, arg)
+    elapsed = time.monotonic() - start
+    await asyncio.sleep(0.1)
+    monitor.stop()
+    stats = monitor.stats()
+    print("{:<8} {:>7.2f}s total  lag p50 {:>6.1f}ms  p95 {:>6.1f}ms  "
+          "max {:>6.1f}ms".format(label, elapsed, stats["p50"] * 1000,
+                                  stats["p95"] * 1000, stats["max"] * 1000))
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    jobs = [(parse_feed, make_feed())] * pages
+    if soupAvailable:
+        jobs += [(parse_search, make_search_page())] * pages
+    else:
+        print("BeautifulSoup is not installed, only parsing XML")
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(measure(loop, "inline", jobs))
+    for mode in ("thread", "process"):
+        pool = ParserPool(loop, mode=mode, workers=2, timeout=60)
+        loop.run_until_complete(measure(loop, mode, jobs, pool))
+        pool.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    main()
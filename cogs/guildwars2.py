@@ -3,6 +3,12 @@ from discord.ext import commands
 from discord.ext.commands.cooldowns import BucketType
 from .utils import checks
 from cogs.utils.dataIO import dataIO
+from cogs.utils.chat_formatting import pagify
+from cogs.utils.dispatcher import Dispatcher
+from cogs.utils.scheduler import Scheduler
+from cogs.utils.timerheap import TimerHeap
+from cogs.utils.parsing import DEFAULT_CONFIG, ParserError, ParserPool
+from cogs.utils.ratelimit import RateBudget
 
 import os
 import asyncio
@@ -10,10 +16,16 @@ import aiohttp
 import re
 import time
 import datetime
+import hashlib
 import xml.etree.ElementTree as et
-from itertools import chain
-from operator import itemgetter
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, defaultdict
+from io import BytesIO
+from operator import mul, sub
+from urllib.parse import quote
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, monitoring
 
 try:
     from bs4 import BeautifulSoup
@@ -24,6 +36,82 @@ except:
 DEFAULT_HEADERS = {'User-Agent': "A GW2 Discord bot",
                    'Accept': 'application/json'}
 
+# Settings fields holding the channel and toggle of each notification feed
+FEEDS = {"build": ("channel", "on"),
+         "daily": ("daily.channel", "daily.on"),
+         "news": ("news.channel", "news.on")}
+
+# Seconds a fetched account inventory is reused by item commands
+INVENTORY_TTL = 60
+# Seconds a trading post price is reused before being fetched again
+PRICE_TTL = 300
+# Seconds between price history snapshots, and between the batches of one
+# snapshot so the collector stays well under the API rate limit
+PRICE_HISTORY_INTERVAL = 1800
+PRICE_HISTORY_DELAY = 0.5
+NEWS_FEED = "https://www.guildwars2.com/en/feed/"
+# Amount of news item hashes remembered to tell new posts from old ones
+NEWS_SEEN_LIMIT = 200
+# Accepted timezone offsets, such as "+2", "-05:30" or "UTC+1"
+TIMEZONE_RE = re.compile(r"^(?:utc|gmt)?\s*([+-]?)(\d{1,2})(?::?(\d{2}))?$",
+                         re.IGNORECASE)
+# Most reminders a server can have, and furthest ahead one can be set
+REMINDER_LIMIT = 25
+REMINDER_MAX_MINUTES = 120
+# Events renamed since reminders could be set for them, old key: new key
+EVENT_RENAMES = {"auric basin: active the pillars":
+                 "auric basin: activate the pillars"}
+# Collections whose names are also wiki page titles, the shortest query
+# matched by prefix against them, and seconds remote results are reused
+WIKI_INDEX_COLLECTIONS = ("items", "achievements", "skills", "skins")
+WIKI_PREFIX_MIN = 4
+WIKI_TTL = 86400
+# Seconds a guild name to id resolution is reused
+GUILD_ID_TTL = 86400
+# Seconds between refreshes of every WvW match
+WVW_INTERVAL = 300
+# Stats ranked by the leaderboard command
+LEADERBOARDS = OrderedDict([("li", "Legendary Insights"),
+                            ("pvp", "PvP rank"),
+                            ("fractal", "Fractal level")])
+# Leaderboard entries older than LEADERBOARD_TTL seconds are refreshed,
+# at most LEADERBOARD_BATCH of them every LEADERBOARD_INTERVAL seconds.
+# A failed refresh is retried after LEADERBOARD_RETRY seconds, doubled on
+# every further failure up to LEADERBOARD_MAX_RETRY.
+# Refreshes make at most LEADERBOARD_RATE API calls per second overall and
+# LEADERBOARD_KEY_RATE per key, leaving the rest of the limit to commands
+LEADERBOARD_TTL = 21600
+LEADERBOARD_INTERVAL = 600
+LEADERBOARD_BATCH = 100
+LEADERBOARD_RATE = 2
+LEADERBOARD_KEY_RATE = 0.5
+LEADERBOARD_PAGE = 15
+LEADERBOARD_RETRY = 600
+LEADERBOARD_MAX_RETRY = 604800
+# Unlock collections: the synced collection holding the catalog, the
+# account endpoint listing unlocks and the fields grouping the catalog,
+# the first of which is summarized in the completion overview
+COLLECTIONS = OrderedDict([
+    ("skins", {"collection": "skins", "endpoint": "account/skins",
+               "fields": ("type", "details.type")}),
+    ("dyes", {"collection": "colors", "endpoint": "account/dyes",
+              "fields": ("categories",)}),
+    ("minis", {"collection": "minis", "endpoint": "account/minis",
+               "fields": ()}),
+    ("outfits", {"collection": "outfits", "endpoint": "account/outfits",
+                 "fields": ()})])
+# Collections synced in a single ids=all request, with their endpoint.
+# Cheap enough to fill at startup if the database predates them
+SMALL_COLLECTIONS = (("pvpranks", "pvp/ranks"), ("colors", "colors"),
+                     ("minis", "minis"), ("outfits", "outfits"))
+# Most missing unlocks listed at once
+MISSING_LIMIT = 60
+# Most price watches a user can have, and seconds between price checks
+WATCH_LIMIT = 25
+WATCH_INTERVAL = 300
+# Prices such as "1g20s5c", "35s" or plain copper
+COINS_RE = re.compile(r"^(?:(\d+)g)?(?:(\d+)s)?(?:(\d+)c?)?$", re.IGNORECASE)
+
 
 
 class APIError(Exception):
@@ -45,23 +133,392 @@ class APIKeyError(APIError):
     pass
 
 
+def endpoint_template(endpoint):
+    """Collapses ids and names in an API endpoint, for metric labels"""
+    parts = endpoint.split("?", 1)[0].split("/")
+    for index, part in enumerate(parts):
+        if part.isdigit() or re.match(r"^[0-9A-F-]{36}$", part, re.I):
+            parts[index] = ":id"
+        elif index == 1 and parts[0] == "characters":
+            parts[index] = ":name"
+    return "/".join(parts)
+
+
+def lookup_field(doc, field):
+    """Value of a dotted field path such as "daily.channel", or None"""
+    for part in field.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+class MongoTimer(monitoring.CommandListener):
+    """Records the duration of Mongo commands per collection"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.collections = {}
+
+    def started(self, event):
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "-"
+        self.collections[event.request_id] = (event.command_name, collection)
+
+    def _finish(self, event, status):
+        command, collection = self.collections.pop(event.request_id,
+                                                   (event.command_name, "-"))
+        self.metrics.observe("mongo_duration_seconds",
+                             event.duration_micros / 1e6, command=command,
+                             collection=collection, status=status)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+def parse_feed(data):
+    """Yields the items of an RSS feed one at a time
+
+    Each item element is cleared once read, so the parsed tree never
+    holds more than one item.
+    """
+    for _, elem in et.iterparse(BytesIO(data)):
+        if elem.tag != "item":
+            continue
+        title = elem.findtext("title")
+        guid = elem.findtext("guid") or elem.findtext("link") or title
+        yield {
+            "hash": hashlib.sha1(guid.encode("utf-8")).hexdigest()[:16],
+            "link": elem.findtext("link"),
+            "title": title,
+            "description": (elem.findtext("description") or "").split("</p>", 1)[0]
+        }
+        elem.clear()
+
+
+def parse_feed_items(data):
+    return list(parse_feed(data))
+
+
+def parse_wiki_search(html):
+    """Returns the link of the first wiki search result, if any"""
+    soup = BeautifulSoup(html, 'html.parser')
+    div = soup.find("div", {"class": "mw-search-result-heading"})
+    a = div.find('a') if div is not None else None
+    return a['href'] if a is not None else None
+
+
+def parse_patchnotes(html):
+    """Returns the link of the latest update notes forum post"""
+    soup = BeautifulSoup(html, 'html.parser')
+    post = soup.find(class_="arenanet topic")
+    return post.find("a")["href"]
+
+
+class AccountInventory:
+    """Item counts of an account, indexed by item id
+
+    Each item id maps to the amount held per location. Locations are
+    "bank", "material" and "shared", or a (character, "bags") and
+    (character, "equipped") pair for every character.
+    """
+
+    def __init__(self, bank, materials, shared, characters):
+        self.created = time.time()
+        self.items = {}
+        self.totals = Counter()
+        self.characters = [c["name"] for c in characters]
+        self._add("bank", bank)
+        self._add("material", materials)
+        self._add("shared", shared)
+        for character in characters:
+            name = character["name"]
+            for bag in character.get("bags", []):
+                if bag is not None:
+                    self._add((name, "bags"), bag["inventory"])
+            self._add((name, "equipped"), character.get("equipment", []))
+
+    def _add(self, location, slots):
+        for slot in slots:
+            if slot is None:
+                continue
+            # Equipped items have no count
+            count = slot.get("count", 1)
+            if not count:
+                continue
+            locations = self.items.setdefault(slot["id"], {})
+            locations[location] = locations.get(location, 0) + count
+            self.totals[slot["id"]] += count
+
+    def count(self, item_id):
+        """Total amount of the item on the account"""
+        return self.totals.get(item_id, 0)
+
+    def locations(self, item_id):
+        """Amount of the item per location"""
+        return self.items.get(item_id, {})
+
+
+class CollectionCatalog:
+    """Every unlock of a collection, as bits of a Python int
+
+    Ids are mapped to dense bit positions in id order, so a set of unlocks
+    is a single int. Comparing an account to the catalog, or to one of its
+    categories, is then a bitwise operation rather than a set of dicts.
+    """
+
+    def __init__(self, docs, fields=()):
+        docs = sorted(docs, key=lambda d: d["_id"])
+        self.ids = [doc["_id"] for doc in docs]
+        self.names = [doc.get("name") or str(doc["_id"]) for doc in docs]
+        self.positions = {item_id: pos for pos, item_id in enumerate(self.ids)}
+        self.all = self._bits(range(len(self.ids)))
+        members = defaultdict(list)
+        self.labels = {}
+        self.main = []
+        for position, doc in enumerate(docs):
+            for number, field in enumerate(fields):
+                values = lookup_field(doc, field)
+                if not isinstance(values, list):
+                    values = [values]
+                for value in values:
+                    if not value:
+                        continue
+                    key = str(value).lower()
+                    if key not in self.labels:
+                        self.labels[key] = str(value)
+                        if not number:
+                            self.main.append(key)
+                    members[key].append(position)
+        self.categories = {k: self._bits(v) for k, v in members.items()}
+        self.main.sort()
+
+    def _bits(self, positions):
+        # Setting bits one by one would copy the whole int every time
+        buffer = bytearray((len(self.ids) + 7) // 8)
+        for position in positions:
+            buffer[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(bytes(buffer), "little")
+
+    def mask(self, ids):
+        """Bits of the given ids, skipping ones not in the catalog"""
+        positions = self.positions
+        return self._bits(positions[i] for i in ids if i in positions)
+
+    @staticmethod
+    def count(bits):
+        return bin(bits).count("1")
+
+    def names_of(self, bits, limit=None):
+        """Names of the set bits, in id order"""
+        names = []
+        while bits and (limit is None or len(names) < limit):
+            lowest = bits & -bits
+            names.append(self.names[lowest.bit_length() - 1])
+            bits ^= lowest
+        return names
+
+
+class PriceWatchIndex:
+    """Trading post price watches, indexed by item and threshold
+
+    Watches wait for an item's lowest sell listing to drop to their price
+    ("below") or to rise to it ("above"). Each direction of an item keeps
+    its thresholds sorted, so the watches a price triggers are found with
+    a bisect instead of checking every watch.
+    """
+
+    def __init__(self):
+        self.items = {}
+
+    def __len__(self):
+        return sum(len(prices) for sides in self.items.values()
+                   for prices, _ in sides.values())
+
+    def add(self, doc):
+        sides = self.items.setdefault(doc["item_id"], {"below": ([], []),
+                                                       "above": ([], [])})
+        prices, ids = sides[doc["direction"]]
+        index = bisect_right(prices, doc["price"])
+        prices.insert(index, doc["price"])
+        ids.insert(index, doc["_id"])
+
+    def remove(self, doc):
+        sides = self.items.get(doc["item_id"])
+        if sides is None:
+            return
+        prices, ids = sides[doc["direction"]]
+        for index in range(bisect_left(prices, doc["price"]),
+                           bisect_right(prices, doc["price"])):
+            if ids[index] == doc["_id"]:
+                del prices[index]
+                del ids[index]
+                break
+        if not any(prices for prices, _ in sides.values()):
+            del self.items[doc["item_id"]]
+
+    def triggered(self, item_id, price):
+        """Ids of the watches on an item crossed by the given price"""
+        sides = self.items.get(item_id)
+        if sides is None:
+            return []
+        prices, ids = sides["below"]
+        below = ids[bisect_left(prices, price):]
+        prices, ids = sides["above"]
+        return below + ids[:bisect_right(prices, price)]
+
+
+class SubscriptionRegistry:
+    """Notification subscriptions of every server, kept in memory
+
+    Mirrors the channel and toggle of each feed in FEEDS from the settings
+    collection, loaded once. Commands that change a subscription write
+    through with update(), so senders never have to query the database.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.feeds = {feed: {} for feed in FEEDS}
+        self.loaded = False
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        async with self._lock:
+            if self.loaded:
+                return
+            feeds = {feed: {} for feed in FEEDS}
+            cursor = self.db.settings.find({}, {"channel": 1, "on": 1,
+                                                "daily": 1, "news": 1})
+            async for server in cursor:
+                for feed, fields in FEEDS.items():
+                    channel, on = (lookup_field(server, f) for f in fields)
+                    feeds[feed][server["_id"]] = {"channel": channel,
+                                                  "on": bool(on)}
+            self.feeds = feeds
+            self.loaded = True
+
+    def update(self, server_id, feed, **state):
+        subscription = self.feeds[feed].setdefault(
+            server_id, {"channel": None, "on": False})
+        subscription.update(state)
+
+    def add_server(self, serverdoc):
+        for feed, fields in FEEDS.items():
+            channel, on = (lookup_field(serverdoc, f) for f in fields)
+            self.update(serverdoc["_id"], feed, channel=channel, on=bool(on))
+
+    def disable_channels(self, feed, channels):
+        channels = set(channels)
+        for subscription in self.feeds[feed].values():
+            if subscription["channel"] in channels:
+                subscription["on"] = False
+
+    async def channels(self, feed):
+        """Channel ids subscribed to a feed"""
+        await self.load()
+        return [s["channel"] for s in self.feeds[feed].values()
+                if s["on"] and s["channel"] is not None]
+
+
 class GuildWars2:
     """Commands using the GW2 API"""
 
     def __init__(self, bot):
         self.bot = bot
-        self.client = AsyncIOMotorClient()
+        self.metrics = bot.metrics
+        self.client = AsyncIOMotorClient(
+            event_listeners=[MongoTimer(self.metrics)])
         self.db = self.client['gw2']
         self.gamedata = dataIO.load_json("data/guildwars2/gamedata.json")
         self.build = dataIO.load_json("data/guildwars2/build.json")
         self.session = aiohttp.ClientSession(loop=self.bot.loop)
         self.cache = dataIO.load_json("data/guildwars2/cache.json")
+        self.config = dataIO.load_json("data/guildwars2/config.json")
+        self.parser = ParserPool.from_config(bot.loop,
+                                             self.config.get("parser"))
         self.boss_schedule = self.generate_schedule()
+        self.professions = self.generate_professions()
+        self.pvp_rank_mins = []
+        self.pvp_ranks = []
+        self.worlds = {}
+        self.world_ids = {}
+        self.wvw_worlds = {}
+        self.wvw_matches = []
+        self.wvw_updated = None
+        self.watches = PriceWatchIndex()
+        self.collections = {}
+        self.leaderboard_budget = RateBudget(LEADERBOARD_RATE,
+                                             LEADERBOARD_KEY_RATE,
+                                             key_capacity=5)
+        self.boss_times = [boss["seconds"] for boss in self.boss_schedule]
+        self.schedule_embeds = {}
+        self.timezones = {}
+        self.events = self.generate_events()
+        for problem in self.check_event_times():
+            print("Event timers: " + problem)
+        self.reminders = defaultdict(dict)
+        self.reminder_timers = TimerHeap(bot.loop, self.fire_reminders)
+        self.register_caches()
+        self.inventories = {}
+        self.prices = {}
+        self.recipe_graph = {}
+        self.craft_memo = {}
+        self.wiki_keys = []
+        self.wiki_titles = []
+        self.wiki_cache = {}
+        self.guild_ids = {}
+        self.dispatcher = Dispatcher(bot)
+        self.subscriptions = SubscriptionRegistry(self.db)
+        self.scheduler = Scheduler(bot.loop)
 
     def __unload(self):
+        self.scheduler.stop()
+        self.reminder_timers.stop()
+        self.parser.shutdown()
+        self.bot.caches.unregister("GuildWars2.")
+        self.bot.loop.create_task(self.close_connections())
+
+    async def close_connections(self):
+        # Jobs still running keep using them until they finish
+        await self.scheduler.join()
         self.session.close()
         self.client.close()
 
+    def register_caches(self):
+        caches = self.bot.caches
+        caches.register("GuildWars2.inventories", lambda: self.inventories,
+                        lambda: self.inventories.clear())
+        caches.register("GuildWars2.prices", lambda: self.prices,
+                        lambda: self.prices.clear())
+        caches.register("GuildWars2.craft_memo", lambda: self.craft_memo,
+                        lambda: self.craft_memo.clear())
+        caches.register("GuildWars2.schedule_embeds",
+                        lambda: self.schedule_embeds,
+                        lambda: self.schedule_embeds.clear())
+        caches.register("GuildWars2.timezones", lambda: self.timezones,
+                        lambda: self.timezones.clear())
+        caches.register("GuildWars2.recipe_graph", lambda: self.recipe_graph)
+        caches.register("GuildWars2.wiki_index", lambda: self.wiki_titles)
+        caches.register("GuildWars2.guild_ids", lambda: self.guild_ids,
+                        lambda: self.guild_ids.clear())
+        caches.register("GuildWars2.wiki_cache", lambda: self.wiki_cache,
+                        lambda: self.wiki_cache.clear())
+        caches.register("GuildWars2.gamedata", lambda: self.gamedata)
+        caches.register("GuildWars2.price_watches", lambda: self.watches)
+        caches.register("GuildWars2.collections", lambda: self.collections)
+        caches.register("GuildWars2.wvw_matches",
+                        lambda: (self.worlds, self.wvw_worlds,
+                                 self.wvw_matches))
+        caches.register("GuildWars2.subscriptions",
+                        lambda: self.subscriptions.feeds)
+
     @commands.group(pass_context=True)
     async def key(self, ctx):
         """Commands related to API keys"""
@@ -125,6 +582,8 @@ class GuildWars2:
         keydoc = await self.fetch_key(user)
         if keydoc:
             await self.db.keys.delete_one({"_id": user.id})
+            await self.db.leaderboards.delete_one({"_id": user.id})
+            self.inventories.pop(user.id, None)
             await self.bot.say("{0.mention}, sucessfuly removed your key. "
                                "You may input a new one.".format(user))
         else:
@@ -172,7 +631,7 @@ class GuildWars2:
             await self.bot.say("Need permission to embed links")
 
     @commands.cooldown(1, 10, BucketType.user)
-    @commands.command(pass_context=True)
+    @commands.group(pass_context=True, invoke_without_command=True)
     async def account(self, ctx):
         """Information about your account
         Requires a key with account scope
@@ -223,28 +682,89 @@ class GuildWars2:
         except discord.HTTPException:
             await self.bot.say("Need permission to embed links")
 
+    @commands.cooldown(1, 60, BucketType.user)
+    @account.command(pass_context=True, name="value")
+    async def account_value(self, ctx):
+        """Estimates what your account's items are worth on the trading post
+        Requires a key with inventories and characters scope
+        """
+        user = ctx.message.author
+        scopes = ["inventories", "characters"]
+        keydoc = await self.fetch_key(user)
+        msg = await self.bot.say("Appraising your account, this might take a while...")
+        try:
+            await self._check_scopes_(user, scopes)
+            inventory = await self.fetch_inventory(user, keydoc)
+            prices = await self.fetch_prices(inventory.items)
+        except APIKeyError as e:
+            await self.bot.say(e)
+            return
+        except APIError as e:
+            await self.bot.say("{0.mention}, API has responded with the following error: "
+                               "`{1}`".format(user, e))
+            return
+        values = self.value_inventory(inventory, prices)
+        total_buy = sum(v[0] for v in values.values())
+        total_sell = sum(v[1] for v in values.values())
+        color = self.getColor(user)
+        data = discord.Embed(description="Account value", colour=color)
+        for location, (buy, sell) in values.items():
+            if buy or sell:
+                data.add_field(name=location, value="Buy orders: {0}\n"
+                               "Sell listings: {1}".format(
+                                   self.gold_to_coins(buy),
+                                   self.gold_to_coins(sell)), inline=False)
+        data.add_field(name="Total", value="Buy orders: {0}\n"
+                       "Sell listings: {1}".format(
+                           self.gold_to_coins(total_buy),
+                           self.gold_to_coins(total_sell)), inline=False)
+        data.set_author(name=keydoc["account_name"])
+        data.set_footer(text="Untradable items are not counted and trading "
+                        "post fees are not deducted")
+        try:
+            await self.bot.edit_message(msg, "{0.mention}, here is your "
+                                        "account's value".format(user), embed=data)
+        except discord.HTTPException:
+            await self.bot.say("Need permission to embed links")
+
     @commands.cooldown(1, 60, BucketType.user)
     @commands.command(pass_context=True)
     async def li(self, ctx):
         """Shows how many Legendary Insights you have
-        Requires a key with inventories and characters scope
+        Requires a key with inventories and characters scope, and wallet
+        scope to include the ones in your wallet
         """
+        await self.counter_handler(ctx, "li")
+
+    @commands.cooldown(1, 60, BucketType.user)
+    @commands.command(pass_context=True)
+    async def count(self, ctx, counter: str=None):
+        """Counts an item family on your account, crafted items included
+        Use without arguments to list available counters.
+        Requires a key with inventories and characters scope, and wallet
+        scope for counters that include currencies
+        """
+        counters = self.gamedata["counters"]
+        if counter is None or counter.lower() not in counters:
+            output = "Available counters are: ```"
+            output += "\n".join("{0} - {1}".format(k, v["name"])
+                                 for k, v in sorted(counters.items()))
+            output += "```"
+            await self.bot.say(output)
+            return
+        await self.counter_handler(ctx, counter.lower())
+
+    async def counter_handler(self, ctx, counter):
         user = ctx.message.author
         scopes = ["inventories", "characters"]
+        family = self.gamedata["counters"][counter]
         keydoc = await self.fetch_key(user)
-        msg = await self.bot.say("Getting legendary insights, this might take a while...")
+        msg = await self.bot.say("Getting {0}, this might take "
+                                 "a while...".format(family["name"].lower()))
         try:
             await self._check_scopes_(user, scopes)
-            key = keydoc["key"]
-            headers = self.construct_headers(key)
-            endpoint_bank = "account/bank"
-            endpoint_material = "account/materials"
-            endpoint_shared = "account/inventory"
-            endpoint_char = "characters?page=0"
-            bank = await self.call_api(endpoint_bank, headers)
-            materials = await self.call_api(endpoint_material, headers)
-            shared = await self.call_api(endpoint_shared, headers)
-            characters = await self.call_api(endpoint_char, headers)
+            inventory = await self.fetch_inventory(user, keydoc)
+            wallet = await self.fetch_wallet(family, keydoc)
         except APIKeyError as e:
             await self.bot.say(e)
             return
@@ -252,165 +772,201 @@ class GuildWars2:
             await self.bot.say("{0.mention}, API has responded with the following error: "
                                "`{1}`".format(user, e))
             return
-
-        # Items to look for
-        ids = self.gamedata.get("insights")
-        id_legendary_insight = ids.get("legendary_insight")
-        id_gift_of_prowess = ids.get("gift_of_prowess")
-        id_envoy_insignia = ids.get("envoy_insignia")
-        ids_refined_envoy_armor = set(ids.get("refined_envoy_armor").values())
-        ids_perfected_envoy_armor = set(ids.get("perfected_envoy_armor").values())
-
-        # Filter empty slots and uninteresting items out of the inventories.
-        #
-        # All inventories are converted to lists as they are used multiple
-        # times. If they stay as generators, the first scan on each will exhaust
-        # them, resulting in empty results for later scans (this was really hard
-        # to track down, since the scans are also generators, so the order of
-        # access to an inventory is not immediately obvious in the code).
-        __pre_filter = ids_perfected_envoy_armor.union(
-            {id_legendary_insight, id_gift_of_prowess, id_envoy_insignia},
-            ids_refined_envoy_armor)
-        # If an item slot is empty, or the item is not interesting, filter it out.
-        pre_filter = lambda a, b=__pre_filter: a is not None and a["id"] in b
-        inv_bank = list(filter(pre_filter, bank))
-        del bank # We don't need these anymore, free them.
-
-        inv_materials = list(filter(pre_filter, materials))
-        del materials
-
-        inv_shared = list(filter(pre_filter, shared))
-        del shared
-
-        # Bags and equipment are a little more complicated
-        # Bags have multiple inventories for each character, so:
-        # Step 5: Discard the empty and uninteresting
-        inv_bags = list(filter(pre_filter,
-            # Step 4: Flatten!
-            chain.from_iterable(
-                # Step 3: Flatten.
-                chain.from_iterable(
-                    # Step 2: Get inventories from each existing bag
-                    (map(itemgetter("inventory"), filter(None, bags)) for bags in
-                        # Step 1: Get all bags
-                        map(itemgetter("bags"), characters))))))
-        # Now we have a simple list of items in all bags on all characters.
-
-        # Step 3: Discard empty and uninteresting
-        equipped = list(filter(pre_filter,
-            # Step 2: Flatten
-            chain.from_iterable(
-                # Step 1: get all character equipment
-                map(itemgetter("equipment"), characters))))
-        del characters
-        # Like the bags, we now have a simple list of character gear
-
-        # Filter out items that don't match the ones we want.
-        # Step 1: Define a test function for filter(). The id is passed in with
-        #         an optional argument to avoid any potential issues with scope.
-        li_scan = lambda a, b=id_legendary_insight: a["id"] == b
-        # Step 2: Filter out all items we don't care about
-        # Step 3: Extract the `count` field.
-        li_bank = map(itemgetter("count"), filter(li_scan, inv_bank))
-        li_materials = map(itemgetter("count"), filter(li_scan, inv_materials))
-        li_shared = map(itemgetter("count"), filter(li_scan, inv_shared))
-        li_bags = map(itemgetter("count"), filter(li_scan, inv_bags))
-
-        prowess_scan = lambda a, b=id_gift_of_prowess: a["id"] == b
-        prowess_bank = map(itemgetter("count"), filter(prowess_scan, inv_bank))
-        prowess_shared = map(itemgetter("count"), filter(prowess_scan, inv_shared))
-        prowess_bags = map(itemgetter("count"), filter(prowess_scan, inv_bags))
-
-        insignia_scan = lambda a, b=id_envoy_insignia: a["id"] == b
-        insignia_bank = map(itemgetter("count"), filter(insignia_scan, inv_bank))
-        insignia_shared = map(itemgetter("count"), filter(insignia_scan, inv_shared))
-        insignia_bags = map(itemgetter("count"), filter(insignia_scan, inv_bags))
-
-        # This one is slightly different: since we are matching against a set
-        # of ids, we use `in` instead of a simple comparison.
-        perfect_armor_scan = lambda a, b=ids_perfected_envoy_armor: a["id"] in b
-        perfect_armor_bank = map(itemgetter("count"), filter(perfect_armor_scan, inv_bank))
-        perfect_armor_shared = map(itemgetter("count"), filter(perfect_armor_scan, inv_shared))
-        perfect_armor_bags = map(itemgetter("count"), filter(perfect_armor_scan, inv_bags))
-        # immediately converting this to a list because we'll need the length
-        # later and that would exhaust the generator, resulting in surprises if
-        # it's used more later.
-        perfect_armor_equipped = list(filter(perfect_armor_scan, equipped))
-
-        # Repeat for Refined Armor
-        refined_armor_scan = lambda a, b=ids_refined_envoy_armor: a["id"] in b
-        refined_armor_bank = map(itemgetter("count"), filter(refined_armor_scan, inv_bank))
-        refined_armor_shared = map(itemgetter("count"), filter(refined_armor_scan, inv_shared))
-        refined_armor_bags = map(itemgetter("count"), filter(refined_armor_scan, inv_bags))
-        refined_armor_equipped = list(filter(refined_armor_scan, equipped))
-
-        # Now that we have all the items we are interested in, it's time to
-        # count them! Easy enough to just `sum` the `chain`.
-        sum_li = sum(chain(li_bank, li_materials, li_bags, li_shared))
-        sum_prowess  = sum(chain(prowess_bank, prowess_shared, prowess_bags))
-        sum_insignia = sum(chain(insignia_bank, insignia_shared, insignia_bags))
-        # Armor is a little different. The ones in inventory have a count like
-        # the other items, but the ones equipped don't, so we can just take the
-        # length of the list there.
-        sum_refined_armor = sum(chain(refined_armor_bank, refined_armor_shared, refined_armor_bags)) + len(refined_armor_equipped)
-        sum_perfect_armor = sum(chain(perfect_armor_bank, perfect_armor_shared, perfect_armor_bags)) + len(perfect_armor_equipped)
-
-        # LI is fine, but the others are composed of 25 or 50 LIs.
-        li_prowess = sum_prowess * 25
-        li_insignia = sum_insignia * 25
-        # Refined Envoy Armor. First set is free!
-        # But, keeping track of it is troublesome. What we do is add up to 6
-        # perfected armor pieces to this (the ones that used the free set), but
-        # not more (`min()`).
-        # Then, subtract 6 for the free set. If one full set of perfected armor
-        # has been crafted, then we have just the count of refined armor. This
-        # is exactly what we want, because the free set is now being counted by
-        # `li_perfect_armor`.
-        li_refined_armor = max(min(sum_perfect_armor, 6) + sum_refined_armor - 6, 0) * 25
-        # Perfected Envoy Armor. First set is half off!
-        li_perfect_armor = min(sum_perfect_armor, 6) * 25 + max(sum_perfect_armor - 6, 0) * 50
-        # Stagger the calculation for detail later.
-        crafted_li = li_prowess + li_insignia + li_perfect_armor + li_refined_armor
-        total_li = sum_li + crafted_li
-
-        # Construct an embed object for better formatting of our data
+        results = self.count_family(family, inventory, wallet)
         embed = discord.Embed()
-        # Right up front, the information everyone wants:
-        embed.title = "{0} Legendary Insights Earned".format(total_li)
-        # Identify the user that asked
+        embed.title = "{0} {1} Earned".format(results["total"], family["name"])
         embed.set_author(name=user.name, icon_url=user.avatar_url)
-        # LI icon as thumbnail looks pretty cool.
-        embed.set_thumbnail(url="https://render.guildwars2.com/file/6D33B7387BAF2E2CC9B5D37D1D1B01246AB6FA22/1302744.png")
-        # Legendary color!
-        embed.colour = 0x4C139D
-        # Quick breakdown. No detail on WHERE all those LI are. That's for $search.
-        embed.description = "{1} on hand, {2} used in crafting".format(total_li, sum_li, crafted_li)
+        if "icon" in family:
+            embed.set_thumbnail(url=family["icon"])
+        if "color" in family:
+            embed.colour = int(family["color"], 0)
+        embed.description = "{0} on hand, {1} used in crafting".format(
+            results["base"], results["crafted"])
         # Save space by skipping empty sections
-        if sum_perfect_armor:
-            embed.add_field(
-                name="{0} Perfected Envoy Armor Pieces".format(sum_perfect_armor),
-                value="Representing {0} Legendary Insights".format(li_perfect_armor),
-                inline=False)
-        if sum_refined_armor:
-            embed.add_field(
-                name="{0} Refined Envoy Armor Pieces".format(sum_refined_armor),
-                value="Representing {0} Legendary Insights".format(li_refined_armor),
-                inline=False)
-        if sum_prowess:
-            embed.add_field(
-                name="{0} Gifts of Prowess".format(sum_prowess),
-                value="Representing {0} Legendary Insights".format(li_prowess),
-                inline=False)
-        if sum_insignia:
-            embed.add_field(
-                name="{0} Envoy Insignia".format(sum_insignia),
-                value="Representing {0} Legendary Insights".format(li_insignia),
-                inline=False)
-        # Identify the bot
+        for component, count, value in results["components"]:
+            if count:
+                embed.add_field(
+                    name="{0} {1}".format(count, component["name"]),
+                    value="Representing {0} {1}".format(value, family["name"]),
+                    inline=False)
         embed.set_footer(text=self.bot.user.name, icon_url=self.bot.user.avatar_url)
+        await self.bot.edit_message(msg, "{0.mention}, here are your "
+                                    "{1}".format(user, family["name"]), embed=embed)
 
-        # Edit the embed into the initial message.
-        await self.bot.edit_message(msg, "{0.mention}, here are your Legendary Insights".format(user), embed=embed)
+    @commands.cooldown(1, 10, BucketType.user)
+    @commands.command(pass_context=True, no_pm=True)
+    async def leaderboard(self, ctx, stat: str, page: int=1):
+        """Ranks the members of this server who have added a key
+        Stat can be li, pvp or fractal.
+        Stats are refreshed in the background every few hours, and only
+        when the key has the scopes they need.
+        """
+        user = ctx.message.author
+        server = ctx.message.server
+        stat = stat.lower()
+        if stat not in LEADERBOARDS:
+            await self.bot.say("Stat must be one of: {0}".format(
+                ", ".join(LEADERBOARDS)))
+            return
+        query = {"_id": {"$in": [m.id for m in server.members]},
+                 stat: {"$exists": True}}
+        total = await self.db.leaderboards.count(query)
+        if not total:
+            await self.bot.say("Nobody in this server is ranked yet. Stats of "
+                               "newly added keys show up within a few minutes.")
+            return
+        pages = (total + LEADERBOARD_PAGE - 1) // LEADERBOARD_PAGE
+        page = min(max(page, 1), pages)
+        start = (page - 1) * LEADERBOARD_PAGE
+        cursor = self.db.leaderboards.find(query, {"account_name": 1, stat: 1})
+        cursor = cursor.sort(stat, -1).skip(start).limit(LEADERBOARD_PAGE)
+        output = ["{0} leaderboard of {1}".format(LEADERBOARDS[stat],
+                                                  server.name), ""]
+        rank = start
+        async for doc in cursor:
+            rank += 1
+            output.append("{0:>4}. {1:<32} {2}".format(
+                rank, doc["account_name"], doc[stat]))
+        output.append("")
+        own = await self.db.leaderboards.find_one({"_id": user.id,
+                                                   stat: {"$exists": True}})
+        if own is not None:
+            query[stat] = {"$gt": own[stat]}
+            above = await self.db.leaderboards.count(query)
+            output.append("You are ranked {0} of {1}".format(above + 1, total))
+        output.append("Page {0} of {1}".format(page, pages))
+        await self.bot.say("```{0}```".format("\n".join(output)))
+
+    @commands.cooldown(1, 10, BucketType.user)
+    @commands.group(pass_context=True, invoke_without_command=True)
+    async def skins(self, ctx):
+        """Your skin collection's completion
+        Requires a key with unlocks scope
+        """
+        await self.collection_handler(ctx, "skins")
+
+    @commands.cooldown(1, 10, BucketType.user)
+    @skins.command(pass_context=True, name="missing")
+    async def skins_missing(self, ctx, *, category: str=None):
+        """Skins you haven't unlocked yet
+        Optionally only of a type, such as armor, coat or greatsword.
+        Requires a key with unlocks scope
+        """
+        await self.collection_handler(ctx, "skins", category, missing=True)
+
+    @commands.cooldown(1, 10, BucketType.user)
+    @commands.group(pass_context=True, invoke_without_command=True)
+    async def dyes(self, ctx):
+        """Your dye collection's completion
+        Requires a key with unlocks scope
+        """
+        await self.collection_handler(ctx, "dyes")
+
+    @commands.cooldown(1, 10, BucketType.user)
+    @dyes.command(pass_context=True, name="missing")
+    async def dyes_missing(self, ctx, *, category: str=None):
+        """Dyes you haven't unlocked yet
+        Optionally only of a category, such as red, metal or rare.
+        Requires a key with unlocks scope
+        """
+        await self.collection_handler(ctx, "dyes", category, missing=True)
+
+    @commands.cooldown(1, 10, BucketType.user)
+    @commands.group(pass_context=True, invoke_without_command=True)
+    async def minis(self, ctx):
+        """Your miniature collection's completion
+        Requires a key with unlocks scope
+        """
+        await self.collection_handler(ctx, "minis")
+
+    @commands.cooldown(1, 10, BucketType.user)
+    @minis.command(pass_context=True, name="missing")
+    async def minis_missing(self, ctx):
+        """Miniatures you haven't unlocked yet
+        Requires a key with unlocks scope
+        """
+        await self.collection_handler(ctx, "minis", missing=True)
+
+    @commands.cooldown(1, 10, BucketType.user)
+    @commands.group(pass_context=True, invoke_without_command=True)
+    async def outfits(self, ctx):
+        """Your outfit collection's completion
+        Requires a key with unlocks scope
+        """
+        await self.collection_handler(ctx, "outfits")
+
+    @commands.cooldown(1, 10, BucketType.user)
+    @outfits.command(pass_context=True, name="missing")
+    async def outfits_missing(self, ctx):
+        """Outfits you haven't unlocked yet
+        Requires a key with unlocks scope
+        """
+        await self.collection_handler(ctx, "outfits", missing=True)
+
+    async def collection_handler(self, ctx, name, category=None,
+                                 missing=False):
+        user = ctx.message.author
+        catalog = self.collections.get(name)
+        if catalog is None or not catalog.ids:
+            await self.bot.say("The {0} catalog isn't loaded yet, try again "
+                               "later".format(name))
+            return
+        scope = catalog.all
+        label = name
+        if category is not None:
+            key = category.lower()
+            if key not in catalog.categories:
+                await self.bot.say("No such category. Categories are: "
+                                   "{0}".format(", ".join(sorted(
+                                       catalog.labels.values()))))
+                return
+            scope = catalog.categories[key]
+            label = "{0} {1}".format(catalog.labels[key], name)
+        keydoc = await self.fetch_key(user)
+        try:
+            await self._check_scopes_(user, ["unlocks"])
+            headers = self.construct_headers(keydoc["key"])
+            unlocked = await self.call_api(COLLECTIONS[name]["endpoint"],
+                                           headers)
+        except APIKeyError as e:
+            await self.bot.say(e)
+            return
+        except APIError as e:
+            await self.bot.say("{0.mention}, API has responded with the following error: "
+                               "`{1}`".format(user, e))
+            return
+        owned = catalog.mask(unlocked)
+        if missing:
+            lacking = scope & ~owned
+            count = catalog.count(lacking)
+            if not count:
+                await self.bot.say("{0.mention}, you have every one of the "
+                                   "{1}!".format(user, label))
+                return
+            output = ["{0} missing {1}".format(count, label), ""]
+            output += catalog.names_of(lacking, MISSING_LIMIT)
+            if count > MISSING_LIMIT:
+                output.append("...and {0} more".format(count - MISSING_LIMIT))
+            for page in pagify("\n".join(output), shorten_by=16):
+                await self.bot.say("```\n{0}```".format(page))
+            return
+        have = catalog.count(owned & scope)
+        total = catalog.count(scope)
+        color = self.getColor(user)
+        data = discord.Embed(title="{0} of {1} {2} unlocked ({3:.1%})".format(
+            have, total, label, have / total), colour=color)
+        for key in catalog.main[:25]:
+            bits = catalog.categories[key]
+            have = catalog.count(owned & bits)
+            total = catalog.count(bits)
+            data.add_field(name=catalog.labels[key],
+                           value="{0}/{1} ({2:.1%})".format(have, total,
+                                                            have / total))
+        data.set_author(name=keydoc["account_name"])
+        try:
+            await self.bot.say(embed=data)
+        except discord.HTTPException:
+            await self.bot.say("Need permission to embed links")
 
     @commands.group(pass_context=True)
     async def character(self, ctx):
@@ -461,9 +1017,8 @@ class GuildWars2:
         profession = results["profession"]
         race = results["race"]
         guild = results["guild"]
-        color = self.gamedata["professions"][profession.lower()]["color"]
-        color = int(color, 0)
-        icon = self.gamedata["professions"][profession.lower()]["icon"]
+        color = self.professions[profession]["color"]
+        icon = self.professions[profession]["icon"]
         data = discord.Embed(description=title, colour=color)
         data.set_thumbnail(url=icon)
         data.add_field(name="Created at", value=created)
@@ -570,9 +1125,8 @@ class GuildWars2:
                             gear[piece]["stat"] = ""
         profession = results["profession"]
         level = results["level"]
-        color = self.gamedata["professions"][profession.lower()]["color"]
-        icon = self.gamedata["professions"][profession.lower()]["icon"]
-        color = int(color, 0)
+        color = self.professions[profession]["color"]
+        icon = self.professions[profession]["icon"]
         data = discord.Embed(description="Gear", colour=color)
         for piece in pieces:
             if gear[piece]["id"] is not None:
@@ -824,17 +1378,13 @@ class GuildWars2:
         """
         user = ctx.message.author
         color = self.getColor(user)
-        guild = guild_name.replace(' ', '%20')
         scopes = ["guilds"]
-        endpoint_id = "guild/search?name={0}".format(guild)
         keydoc = await self.fetch_key(user)
         try:
             await self._check_scopes_(user, scopes)
             key = keydoc["key"]
             headers = self.construct_headers(key)
-            guild_id = await self.call_api(endpoint_id)
-            guild_id = str(guild_id).strip("['")
-            guild_id = str(guild_id).strip("']")
+            guild_id = await self.fetch_guild_id(guild_name)
             endpoint = "guild/{0}".format(guild_id)
             results = await self.call_api(endpoint, headers)
         except APINotFound:
@@ -881,17 +1431,13 @@ class GuildWars2:
         Requires key with guilds scope and also Guild Leader permissions ingame"""
         user = ctx.message.author
         color = self.getColor(user)
-        guild = guild_name.replace(' ', '%20')
         scopes = ["guilds"]
-        endpoint_id = "guild/search?name={0}".format(guild)
         keydoc = await self.fetch_key(user)
         try:
             await self._check_scopes_(user, scopes)
             key = keydoc["key"]
             headers = self.construct_headers(key)
-            guild_id = await self.call_api(endpoint_id)
-            guild_id = str(guild_id).strip("['")
-            guild_id = str(guild_id).strip("']")
+            guild_id = await self.fetch_guild_id(guild_name)
             endpoint = "guild/{0}/members".format(guild_id)
             endpoint_ranks = "guild/{0}/ranks".format(guild_id)
             ranks = await self.call_api(endpoint_ranks, headers)
@@ -909,35 +1455,27 @@ class GuildWars2:
             await self.bot.say("{0.mention}, API has responded with the following error: "
                                "`{1}`".format(user, e))
             return
-        guild = guild.replace('%20', ' ')
-        data = discord.Embed(description='Members of {0}'.format(
-            guild.title()), colour=color)
-        data.set_author(name=guild.title())
-        counter = 0
-        order_id = 1
-        # For each order the rank has, go through each member and add it with
-        # the current order increment to the embed
-        for order in ranks:
-            for member in results:
-                # Filter invited members
-                if member['rank'] != "invited":
-                    member_rank = member['rank']
-                    # associate order from /ranks with rank from /members
-                    for rank in ranks:
-                        if member_rank == rank['id']:
-                            # await self.bot.say('DEBUG: ' + member['name'] + '
-                            # has rank ' + member_rank + ' and rank has order '
-                            # + str(rank['order']))
-                            if rank['order'] == order_id:
-                                if counter < 20:
-                                    data.add_field(
-                                        name=member['name'], value=member['rank'])
-                                    counter += 1
-            order_id += 1
-        try:
-            await self.bot.say(embed=data)
-        except discord.HTTPException:
-            await self.bot.say("Need permission to embed links")
+        guild = guild_name.title()
+        order = {rank["id"]: rank["order"] for rank in ranks}
+        last = len(ranks) + 1
+        # Invited members have no rank yet, leave them out
+        members = sorted((m for m in results if m["rank"] != "invited"),
+                         key=lambda m: (order.get(m["rank"], last),
+                                        m["name"].lower()))
+        pages = self.member_pages(members)
+        for number, fields in enumerate(pages, 1):
+            data = discord.Embed(description='Members of {0}'.format(guild),
+                                 colour=color)
+            data.set_author(name=guild)
+            for rank, names in fields:
+                data.add_field(name=rank, value="\n".join(names), inline=False)
+            if len(pages) > 1:
+                data.set_footer(text="Page {0}/{1}".format(number, len(pages)))
+            try:
+                await self.bot.say(embed=data)
+            except discord.HTTPException:
+                await self.bot.say("Need permission to embed links")
+                return
 
     @commands.cooldown(1, 20, BucketType.user)
     @guild.command(pass_context=True, name="treasury")
@@ -946,17 +1484,13 @@ class GuildWars2:
            Requires key with guilds scope and also Guild Leader permissions ingame"""
         user = ctx.message.author
         color = self.getColor(user)
-        guild = guild_name.replace(' ', '%20')
         scopes = ["guilds"]
-        endpoint_id = "guild/search?name={0}".format(guild)
         keydoc = await self.fetch_key(user)
         try:
             await self._check_scopes_(user, scopes)
             key = keydoc["key"]
             headers = self.construct_headers(key)
-            guild_id = await self.call_api(endpoint_id)
-            guild_id = str(guild_id).strip("['")
-            guild_id = str(guild_id).strip("']")
+            guild_id = await self.fetch_guild_id(guild_name)
             endpoint = "guild/{0}/treasury".format(guild_id)
             treasury = await self.call_api(endpoint, headers)
         except APIKeyError as e:
@@ -972,10 +1506,10 @@ class GuildWars2:
             await self.bot.say("{0.mention}, API has responded with the following error: "
                                "`{1}`".format(user, e))
             return
-        guild = guild.replace('%20', ' ')
+        guild = guild_name.title()
         data = discord.Embed(description='Treasury contents of {0}'.format(
-            guild.title()), colour=color)
-        data.set_author(name=guild.title())
+            guild), colour=color)
+        data.set_author(name=guild)
         counter = 0
         item_counter = 0
         amount = 0
@@ -1007,6 +1541,35 @@ class GuildWars2:
         except discord.HTTPException:
             await self.bot.say("Need permission to embed links")
 
+    def member_pages(self, members, page_size=4000):
+        """Splits ordered members into embed pages of (rank, names) fields
+
+        Fields stay under Discord's 1024 character and 25 field limits, and
+        each page under page_size characters.
+        """
+        pages = [[]]
+        size = 0
+        for member in members:
+            fields = pages[-1]
+            entry = len(member["name"]) + 1
+            new_field = (not fields or fields[-1][0] != member["rank"] or
+                         fields[-1][2] + entry > 1024)
+            added = entry + (len(member["rank"]) if new_field else 0)
+            if fields and (size + added > page_size or
+                           new_field and len(fields) == 25):
+                pages.append([])
+                fields = pages[-1]
+                size = 0
+                new_field = True
+                added = entry + len(member["rank"])
+            if new_field:
+                fields.append([member["rank"], [], 0])
+            fields[-1][1].append(member["name"])
+            fields[-1][2] += entry
+            size += added
+        return [[(rank, names) for rank, names, _ in page]
+                for page in pages if page]
+
     @commands.group(pass_context=True)
     async def pvp(self, ctx):
         """PvP related commands.
@@ -1052,15 +1615,7 @@ class GuildWars2:
             rankedwinratio = int((rankedwins / rankedgamesplayed) * 100)
         else:
             rankedwinratio = 0
-        rank_id = results["pvp_rank"] // 10 + 1
-        endpoint_ranks = "pvp/ranks/{0}".format(rank_id)
-        try:
-            rank = await self.call_api(endpoint_ranks)
-        except APIError as e:
-            await self.bot.say("{0.mention}, API has responded with the following error: "
-                               "`{1}`".format(user, e))
-            return
-        rank_icon = rank["icon"]
+        rank = self.find_pvp_rank(results["pvp_rank"])
         color = self.getColor(user)
         data = discord.Embed(description=None, colour=color)
         data.add_field(name="Rank", value=pvprank, inline=False)
@@ -1073,7 +1628,8 @@ class GuildWars2:
         data.add_field(name="Ranked winratio",
                        value="{}%".format(rankedwinratio))
         data.set_author(name=accountname)
-        data.set_thumbnail(url=rank_icon)
+        if rank is not None:
+            data.set_thumbnail(url=rank["icon"])
         try:
             await self.bot.say(embed=data)
         except discord.HTTPException:
@@ -1104,28 +1660,36 @@ class GuildWars2:
                                "`{1}`".format(user, e))
             return
         accountname = keydoc["account_name"]
-        professions = self.gamedata["professions"].keys()
         if not profession:
-            for profession in professions:
-                if profession in results["professions"]:
-                    wins = results["professions"][profession]["wins"] + \
-                        results["professions"][profession]["byes"]
-                    total = sum(results["professions"][profession].values())
-                    winratio = int((wins / total) * 100)
-                    professionsformat[profession] = {
-                        "wins": wins, "total": total, "winratio": winratio}
-            mostplayed = max(professionsformat,
-                             key=lambda i: professionsformat[i]['total'])
-            icon = self.gamedata["professions"][mostplayed]["icon"]
+            mostplayed = highestwinrate = leastplayed = lowestestwinrate = None
+            # Single pass keeping the four extremes
+            for profession, stats in results["professions"].items():
+                total = sum(stats.values())
+                if profession not in self.professions or not total:
+                    continue
+                wins = stats["wins"] + stats["byes"]
+                stats = {"wins": wins, "total": total,
+                         "winratio": int((wins / total) * 100)}
+                professionsformat[profession] = stats
+                if mostplayed is None:
+                    mostplayed = highestwinrate = profession
+                    leastplayed = lowestestwinrate = profession
+                    continue
+                if total > professionsformat[mostplayed]["total"]:
+                    mostplayed = profession
+                if total < professionsformat[leastplayed]["total"]:
+                    leastplayed = profession
+                if stats["winratio"] > professionsformat[highestwinrate]["winratio"]:
+                    highestwinrate = profession
+                if stats["winratio"] < professionsformat[lowestestwinrate]["winratio"]:
+                    lowestestwinrate = profession
+            if mostplayed is None:
+                await self.bot.say("You haven't played any profession yet!")
+                return
+            icon = self.professions[mostplayed]["icon"]
             mostplayedgames = professionsformat[mostplayed]["total"]
-            highestwinrate = max(
-                professionsformat, key=lambda i: professionsformat[i]["winratio"])
             highestwinrategames = professionsformat[highestwinrate]["winratio"]
-            leastplayed = min(professionsformat,
-                              key=lambda i: professionsformat[i]["total"])
             leastplayedgames = professionsformat[leastplayed]["total"]
-            lowestestwinrate = min(
-                professionsformat, key=lambda i: professionsformat[i]["winratio"])
             lowestwinrategames = professionsformat[lowestestwinrate]["winratio"]
             color = self.getColor(user)
             data = discord.Embed(description="Professions", colour=color)
@@ -1145,7 +1709,7 @@ class GuildWars2:
                 await self.bot.say(embed=data)
             except discord.HTTPException:
                 await self.bot.say("Need permission to embed links")
-        elif profession.lower() not in self.gamedata["professions"]:
+        elif profession.lower() not in self.professions:
             await self.bot.say("Invalid profession")
         elif profession.lower() not in results["professions"]:
             await self.bot.say("You haven't played that profession!")
@@ -1154,12 +1718,11 @@ class GuildWars2:
             wins = results["professions"][prof]["wins"] + \
                 results["professions"][prof]["byes"]
             total = sum(results["professions"][prof].values())
-            winratio = int((wins / total) * 100)
-            color = self.gamedata["professions"][prof]["color"]
-            color = int(color, 0)
+            winratio = int((wins / total) * 100) if total else 0
+            info = self.professions[prof]
             data = discord.Embed(
-                description="Stats for {0}".format(prof), colour=color)
-            data.set_thumbnail(url=self.gamedata["professions"][prof]["icon"])
+                description="Stats for {0}".format(prof), colour=info["color"])
+            data.set_thumbnail(url=info["icon"])
             data.add_field(name="Total games played",
                            value="{0}".format(total))
             data.add_field(name="Wins", value="{0}".format(wins))
@@ -1260,92 +1823,144 @@ class GuildWars2:
         if not wid:
             await self.bot.say("Invalid world name")
             return
-        try:
-            endpoint = "wvw/matches?world={0}".format(wid)
-            results = await self.call_api(endpoint)
-            endpoint_ = "worlds?id={0}".format(wid)
-            worldinfo = await self.call_api(endpoint_)
-            worldname = worldinfo["name"]
-            population = worldinfo["population"]
-        except APIError as e:
-            await self.bot.say("{0.mention}, API has responded with the following error: "
-                               "`{1}`".format(user, e))
-            return
-        worldcolor = ""
-        for key, value in results["all_worlds"].items():
-            if wid in value:
-                worldcolor = key
-        if not worldcolor:
+        if not self.wvw_worlds:
+            try:
+                await self.refresh_wvw()
+            except APIError as e:
+                await self.bot.say("{0.mention}, API has responded with the following error: "
+                                   "`{1}`".format(user, e))
+                return
+        stats = self.wvw_worlds.get(wid)
+        if stats is None:
             await self.bot.say("Could not resolve world's color")
             return
+        worldcolor = stats["color"]
         if worldcolor == "red":
             color = discord.Colour.red()
         elif worldcolor == "green":
             color = discord.Colour.green()
         else:
             color = discord.Colour.blue()
-        score = results["scores"][worldcolor]
-        ppt = 0
-        victoryp = results["victory_points"][worldcolor]
-        for m in results["maps"]:
-            for objective in m["objectives"]:
-                if objective["owner"].lower() == worldcolor:
-                    ppt += objective["points_tick"]
+        world = self.worlds[wid]
+        population = world["population"]
         if population == "VeryHigh":
             population = "Very high"
-        kills = results["kills"][worldcolor]
-        deaths = results["deaths"][worldcolor]
-        kd = round((kills / deaths), 2)
         data = discord.Embed(description="Performance", colour=color)
-        data.add_field(name="Score", value=score)
-        data.add_field(name="Points per tick", value=ppt)
-        data.add_field(name="Victory Points", value=victoryp)
-        data.add_field(name="K/D ratio", value=str(kd), inline=False)
+        data.add_field(name="Score", value=stats["score"])
+        data.add_field(name="Points per tick", value=stats["ppt"])
+        data.add_field(name="Victory Points", value=stats["victory_points"])
+        data.add_field(name="K/D ratio", value=str(stats["kd"]), inline=False)
         data.add_field(name="Population", value=population, inline=False)
-        data.set_author(name=worldname)
+        data.set_author(name=world["name"])
+        data.set_footer(text="Updated {0} ago".format(self.format_timedelta(
+            datetime.timedelta(seconds=time.time() - self.wvw_updated))))
         try:
             await self.bot.say(embed=data)
         except discord.HTTPException:
             await self.bot.say("Need permission to embed links")
 
+    @commands.cooldown(1, 10, BucketType.user)
+    @wvw.command(pass_context=True, name="matchup")
+    async def wvw_matchup(self, ctx, region: str=None):
+        """Scores of every matchup, optionally only of na or eu"""
+        user = ctx.message.author
+        regions = {"na": "1", "eu": "2"}
+        if region is not None and region.lower() not in regions:
+            await self.bot.say("Region must be na or eu")
+            return
+        if not self.wvw_matches:
+            try:
+                await self.refresh_wvw()
+            except APIError as e:
+                await self.bot.say("{0.mention}, API has responded with the following error: "
+                                   "`{1}`".format(user, e))
+                return
+        names = {"1": "NA", "2": "EU"}
+        output = []
+        for match in self.wvw_matches:
+            match_region, tier = match["id"].split("-")
+            if region is not None and regions[region.lower()] != match_region:
+                continue
+            output.append("# {0} tier {1}".format(names.get(match_region, "?"),
+                                                  tier))
+            for color in sorted(match["colors"],
+                                key=lambda c: -match["colors"][c]["victory_points"]):
+                stats = match["colors"][color]
+                output.append("{0:<24} VP {1:>3}  Score {2:>6}  PPT {3:>3}  "
+                              "K/D {4}".format(stats["name"][:24],
+                                               stats["victory_points"],
+                                               stats["score"], stats["ppt"],
+                                               stats["kd"]))
+            output.append("")
+        output.append("Updated {0} ago".format(self.format_timedelta(
+            datetime.timedelta(seconds=time.time() - self.wvw_updated))))
+        for page in pagify("\n".join(output), ["\n#"], shorten_by=16):
+            await self.bot.say("```markdown\n{0}```".format(page))
+
     @commands.command(pass_context=True)
     async def gw2wiki(self, ctx, *search):
         """Search the guild wars 2 wiki
         Returns the first result, will not always be accurate.
         """
-        if not soupAvailable:
-            await self.bot.say("BeautifulSoup needs to be installed "
-                               "for this command to work.")
+        query = " ".join(search).strip()
+        if not query:
+            await self.bot.send_cmd_help(ctx)
             return
-        search = "+".join(search)
-        wiki = "http://wiki.guildwars2.com/"
         wiki_ = "http://wiki.guildwars2.com"
-        search = search.replace(" ", "+")
         user = ctx.message.author
-        url = wiki + \
-            "index.php?title=Special%3ASearch&profile=default&fulltext=Search&search={0}".format(
-                search)
-        async with self.session.get(url) as r:
-            results = await r.text()
-            soup = BeautifulSoup(results, 'html.parser')
-        try:
-            div = soup.find("div", {"class": "mw-search-result-heading"})
-            a = div.find('a')
-            link = a['href']
+        link = self.wiki_lookup(query)
+        if link is None:
+            if not soupAvailable:
+                await self.bot.say("BeautifulSoup needs to be installed "
+                                   "for this command to work.")
+                return
+            try:
+                link = await self.wiki_search(query)
+            except ParserError as e:
+                await self.bot.say("{0.mention}, couldn't search the wiki: "
+                                   "{1}".format(user, e))
+                return
+        if link:
             await self.bot.say("{0.mention}: {1}{2}".format(user, wiki_, link))
-        except:
+        else:
             await self.bot.say("{0.mention}, no results found".format(user))
 
 
-    @commands.command(pass_context=True, aliases=["eventtimer", "eventtimers"])
+    @commands.group(pass_context=True, invoke_without_command=True,
+                    aliases=["eventtimer", "eventtimers"])
     async def et(self, ctx):
-        """The event timer. Shows upcoming world bosses."""
-        embed = self.schedule_embed(self.get_upcoming_bosses())
+        """The event timer. Shows upcoming world bosses.
+
+        Times are shown in your timezone, or the server's if you haven't
+        set one. See $et timezone"""
+        offset = await self.fetch_timezone(ctx.message.author,
+                                           ctx.message.server)
+        embed = self.schedule_embed(offset)
         try:
             await self.bot.say(embed=embed)
         except:
             await self.bot.say("Need permission to embed links")
 
+    @et.command(pass_context=True, name="timezone")
+    async def et_timezone(self, ctx, offset=None):
+        """Sets your timezone as an offset from UTC
+
+        Example: $et timezone +2, or $et timezone -5:30
+        Issue without an offset to reset it."""
+        user = ctx.message.author
+        await self.timezone_handler(user.id, offset)
+
+    @checks.admin_or_permissions(manage_server=True)
+    @et.command(pass_context=True, name="servertimezone", no_pm=True)
+    async def et_servertimezone(self, ctx, offset=None):
+        """Sets the default timezone of this server
+
+        Used for members who haven't set their own.
+        Example: $et servertimezone +1
+        Issue without an offset to reset it."""
+        server = ctx.message.server
+        await self.timezone_handler(server.id, offset)
+
     @commands.command(pass_context=True, aliases=["hottimer", "hottimers"])
     async def hotet(self, ctx):
         """The event timer. Shows current progression of hot maps."""
@@ -1381,6 +1996,87 @@ class GuildWars2:
             output = output + "\n"
         await self.bot.say("```markdown\n" + output + "```")
 
+    @checks.admin_or_permissions(manage_server=True)
+    @commands.group(pass_context=True, no_pm=True, aliases=["reminders"])
+    async def reminder(self, ctx):
+        """Reminders of world bosses and meta events"""
+        if ctx.invoked_subcommand is None:
+            await self.bot.send_cmd_help(ctx)
+
+    @reminder.command(pass_context=True, name="add")
+    async def reminder_add(self, ctx, minutes: int, *, event):
+        """Reminds this channel before an event starts
+
+        Mention a role to have it pinged as well.
+        Example: $reminder add 10 tequatl @Raiders
+        See $reminder events for the event names"""
+        message = ctx.message
+        if not 0 <= minutes <= REMINDER_MAX_MINUTES:
+            await self.bot.say("Reminders can be set up to {} minutes before "
+                               "an event".format(REMINDER_MAX_MINUTES))
+            return
+        role = message.role_mentions[0] if message.role_mentions else None
+        query = re.sub(r"<@&\d+>", "", event).strip()
+        matches = self.find_events(query)
+        if len(matches) != 1:
+            if matches:
+                names = ", ".join(self.events[x]["name"] for x in matches[:10])
+                await self.bot.say("Multiple events found: {}".format(names))
+            else:
+                await self.bot.say("No such event. See `$reminder events`")
+            return
+        key = matches[0]
+        count = await self.db.reminders.count({"server": message.server.id})
+        if count >= REMINDER_LIMIT:
+            await self.bot.say("This server already has {} reminders, remove "
+                               "some first".format(REMINDER_LIMIT))
+            return
+        doc = {"server": message.server.id, "channel": message.channel.id,
+               "event": key, "minutes": minutes,
+               "role": role.id if role else None}
+        await self.db.reminders.insert_one(doc)
+        self.add_reminder(doc)
+        await self.bot.say("Reminding this channel {} minutes before {}"
+                           "".format(minutes, self.events[key]["name"]))
+
+    @reminder.command(pass_context=True, name="list")
+    async def reminder_list(self, ctx):
+        """Lists the reminders of this server"""
+        server = ctx.message.server
+        docs = await self.server_reminders(server)
+        if not docs:
+            await self.bot.say("This server has no reminders")
+            return
+        output = []
+        for number, doc in enumerate(docs, 1):
+            channel = server.get_channel(doc["channel"])
+            role = discord.utils.get(server.roles, id=doc["role"])
+            output.append("{}. {} minutes before {} in #{}{}".format(
+                number, doc["minutes"], self.events[doc["event"]]["name"],
+                channel.name if channel else "deleted-channel",
+                ", pinging " + role.name if role else ""))
+        await self.bot.say("```\n{}```".format("\n".join(output)))
+
+    @reminder.command(pass_context=True, name="remove")
+    async def reminder_remove(self, ctx, number: int):
+        """Removes a reminder, by its number in $reminder list"""
+        docs = await self.server_reminders(ctx.message.server)
+        if not 0 < number <= len(docs):
+            await self.bot.say("No reminder with that number")
+            return
+        doc = docs[number - 1]
+        await self.db.reminders.delete_one({"_id": doc["_id"]})
+        self.reminders[(doc["event"], doc["minutes"])].pop(doc["_id"], None)
+        await self.bot.say("Reminder removed")
+
+    @reminder.command(pass_context=True, name="events")
+    async def reminder_events(self, ctx):
+        """Lists the events reminders can be set for"""
+        names = [event["name"] for event in self.events.values()]
+        for page in pagify("\n".join(names)):
+            await self.bot.whisper("```\n{}```".format(page))
+        await self.bot.say("Sent you the list of events")
+
     @commands.group(pass_context=True, aliases=["d"])
     async def daily(self, ctx):
         """Commands showing daily things"""
@@ -1476,6 +2172,7 @@ class GuildWars2:
                          "daily" : {"on": False, "channel": None},
                          "news" : {"on": False, "channel": None}}
             await self.db.settings.insert_one(serverdoc)
+            self.subscriptions.add_server(serverdoc)
         if ctx.invoked_subcommand is None or isinstance(ctx.invoked_subcommand, commands.Group):
             await self.bot.send_cmd_help(ctx)
             return
@@ -1494,6 +2191,7 @@ class GuildWars2:
                                "messages to {0.mention}".format(channel))
             return
         await self.db.settings.update_one({"_id": server.id}, {"$set": {"daily.channel": channel.id}})
+        self.subscriptions.update(server.id, "daily", channel=channel.id)
         channel = await self.get_daily_channel(server)
         try:
             endpoint = "achievements/daily"
@@ -1513,6 +2211,7 @@ class GuildWars2:
         server = ctx.message.server
         if on_off is not None:
             await self.db.settings.update_one({"_id": server.id}, {"$set": {"daily.on" : on_off}})
+            self.subscriptions.update(server.id, "daily", on=on_off)
         serverdoc = await self.fetch_server(server)
         if serverdoc["daily"]["on"]:
             await self.bot.say("I will notify you on this server about dailies")
@@ -1596,6 +2295,7 @@ class GuildWars2:
                          "daily" : {"on": False, "channel": None},
                          "news" : {"on": False, "channel": None}}
             await self.db.settings.insert_one(serverdoc)
+            self.subscriptions.add_server(serverdoc)
         if ctx.invoked_subcommand is None:
             await self.bot.send_cmd_help(ctx)
 
@@ -1612,6 +2312,7 @@ class GuildWars2:
                                "messages to {0.mention}".format(channel))
             return
         await self.db.settings.update_one({"_id": server.id}, {"$set": {"news.channel": channel.id}})
+        self.subscriptions.update(server.id, "news", channel=channel.id)
         await self.bot.send_message(channel, "I will now send guildwars2.com news "
                                     "to {0.mention}. Make sure it's toggled "
                                     "on using $newsfeed toggle on. ".format(channel))
@@ -1622,6 +2323,7 @@ class GuildWars2:
         server = ctx.message.server
         if on_off is not None:
             await self.db.settings.update_one({"_id": server.id}, {"$set": {"news.on" : on_off}})
+            self.subscriptions.update(server.id, "news", on=on_off)
         serverdoc = await self.fetch_server(server)
         if serverdoc["news"]["on"]:
             await self.bot.say("I will send news from guildwars2.com")
@@ -1644,6 +2346,7 @@ class GuildWars2:
                          "daily" : {"on": False, "channel": None},
                          "news" : {"on": False, "channel": None}}
             await self.db.settings.insert_one(serverdoc)
+            self.subscriptions.add_server(serverdoc)
         if ctx.invoked_subcommand is None:
             await self.bot.send_cmd_help(ctx)
 
@@ -1660,6 +2363,7 @@ class GuildWars2:
                                "messages to {0.mention}".format(channel))
             return
         await self.db.settings.update_one({"_id": server.id}, {"$set": {"channel": channel.id}})
+        self.subscriptions.update(server.id, "build", channel=channel.id)
         channel = await self.get_announcement_channel(server)
         await self.bot.send_message(channel, "I will now send build announcement "
                                     "messages to {0.mention}. Make sure it's "
@@ -1672,6 +2376,7 @@ class GuildWars2:
         server = ctx.message.server
         if on_off is not None:
             await self.db.settings.update_one({"_id": server.id}, {"$set": {"on": on_off}})
+            self.subscriptions.update(server.id, "build", on=on_off)
         serverdoc = await self.fetch_server(server)
         if serverdoc["on"]:
             await self.bot.say("I will notify you on this server about new builds")
@@ -1758,6 +2463,190 @@ class GuildWars2:
         except discord.HTTPException:
             await self.bot.say("Need permission to embed links")
 
+    @commands.cooldown(1, 10, BucketType.user)
+    @tp.command(pass_context=True, name="history")
+    async def tp_history(self, ctx, *, item: str):
+        """Price history of an item
+        Optionally start with the number of days to look back, default is 1
+        Example: $tp history 7 Mystic Coin"""
+        user = ctx.message.author
+        days = 1
+        first, _, rest = item.partition(" ")
+        if first.isdigit() and rest:
+            days = max(min(int(first), 90), 1)
+            item = rest
+        message, choice = await self.item_menu(user, item)
+        if not choice:
+            return
+        since = time.time() - days * 86400
+        start = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        cursor = self.db.pricehistory.find({"item_id": choice["_id"],
+                                            "day": {"$gte": day}})
+        buys, sells = [], []
+        async for bucket in cursor:
+            for t, buy, sell in zip(bucket["t"], bucket["buy"], bucket["sell"]):
+                if t >= since:
+                    buys.append(buy)
+                    sells.append(sell)
+        if not buys:
+            await self.bot.edit_message(message, "No price history recorded for "
+                                        "that item yet.")
+            return
+        color = self.getColor(user)
+        data = discord.Embed(description="Price history over the last {0} "
+                             "day(s)".format(days), colour=color)
+        for name, prices in (("Buy orders", buys), ("Sell listings", sells)):
+            data.add_field(name=name, value="Min: {0}\nMax: {1}\nAverage: "
+                           "{2}".format(self.gold_to_coins(min(prices)),
+                                        self.gold_to_coins(max(prices)),
+                                        self.gold_to_coins(
+                                            sum(prices) // len(prices))),
+                           inline=False)
+        data.set_author(name=choice["name"])
+        data.set_footer(text="{0} snapshots".format(len(buys)))
+        try:
+            await self.bot.edit_message(message, new_content=" ", embed=data)
+        except discord.HTTPException:
+            await self.bot.say("Need permission to embed links")
+
+    @commands.cooldown(1, 10, BucketType.user)
+    @tp.command(pass_context=True, name="watch")
+    async def tp_watch(self, ctx, *, item_price: str):
+        """DMs you when an item's lowest listing crosses a price
+        The price comes last, in copper or as gold, silver and copper.
+        Example: $tp watch Mystic Coin 1g50s"""
+        user = ctx.message.author
+        item, _, price = item_price.rpartition(" ")
+        price = self.parse_coins(price)
+        if not item or not price:
+            await self.bot.say("Give an item and then a price, such as "
+                               "`$tp watch Mystic Coin 1g50s`")
+            return
+        count = await self.db.tpwatches.count({"user": user.id})
+        if count >= WATCH_LIMIT:
+            await self.bot.say("You already watch {0} prices, remove some "
+                               "first".format(WATCH_LIMIT))
+            return
+        message, choice = await self.item_menu(user, item)
+        if not choice:
+            return
+        try:
+            prices = await self.fetch_prices([choice["_id"]])
+        except APIError as e:
+            await self.bot.say("{0.mention}, API has responded with the following error: "
+                               "`{1}`".format(user, e))
+            return
+        current = prices.get(choice["_id"], (0, 0))[1]
+        if not current:
+            await self.bot.edit_message(message, "{0} isn't listed on the "
+                                        "trading post".format(choice["name"]))
+            return
+        if price == current:
+            await self.bot.edit_message(message, "{0} is already listed at "
+                                        "that price".format(choice["name"]))
+            return
+        direction = "below" if price < current else "above"
+        doc = {"user": user.id, "item_id": choice["_id"], "price": price,
+               "direction": direction}
+        await self.db.tpwatches.insert_one(doc)
+        self.watches.add(doc)
+        await self.bot.edit_message(message, "I'll DM you when {0} {1} {2}, "
+                                    "it is at {3} now".format(
+                                        choice["name"],
+                                        "drops to" if direction == "below"
+                                        else "rises to",
+                                        self.gold_to_coins(price),
+                                        self.gold_to_coins(current)))
+
+    @tp.command(pass_context=True, name="watchlist")
+    async def tp_watchlist(self, ctx):
+        """Lists your price watches"""
+        user = ctx.message.author
+        docs = await self.user_watches(user)
+        if not docs:
+            await self.bot.say("You aren't watching any prices")
+            return
+        names = await self.item_names(doc["item_id"] for doc in docs)
+        output = []
+        for number, doc in enumerate(docs, 1):
+            output.append("{0}. {1} {2} {3}".format(
+                number, names.get(doc["item_id"], doc["item_id"]),
+                doc["direction"], self.gold_to_coins(doc["price"])))
+        await self.bot.say("```\n{0}```".format("\n".join(output)))
+
+    @tp.command(pass_context=True, name="unwatch")
+    async def tp_unwatch(self, ctx, number: int):
+        """Removes a price watch, by its number in $tp watchlist"""
+        docs = await self.user_watches(ctx.message.author)
+        if not 0 < number <= len(docs):
+            await self.bot.say("No watch with that number")
+            return
+        doc = docs[number - 1]
+        await self.db.tpwatches.delete_one({"_id": doc["_id"]})
+        self.watches.remove(doc)
+        await self.bot.say("Watch removed")
+
+    @commands.cooldown(1, 10, BucketType.user)
+    @commands.command(pass_context=True)
+    async def craft(self, ctx, *, item: str):
+        """Cheapest way to craft an item using trading post prices
+        Each component is either bought or crafted, whichever is cheaper"""
+        user = ctx.message.author
+        message, choice = await self.item_menu(user, item)
+        if not choice:
+            return
+        item_id = choice["_id"]
+        if item_id not in self.recipe_graph:
+            await self.bot.edit_message(message, "That item has no recipe.")
+            return
+        try:
+            prices = await self.fetch_prices(self.recipe_tree(item_id))
+        except APIError as e:
+            await self.bot.say("{0.mention}, API has responded with the following error: "
+                               "`{1}`".format(user, e))
+            return
+        now = time.time()
+        craft = self.resolve_craft(item_id, prices, now)[3]
+        buy = prices.get(item_id, (0, 0))[1]
+        if craft is None:
+            await self.bot.edit_message(message, "That item can't be crafted "
+                                        "from its own components.")
+            return
+        # Even when buying is cheaper, show what crafting would take
+        _, (output, ingredients), missing = craft
+        names = {}
+        cursor = self.db.items.find({"_id": {"$in": [i for i, _ in ingredients] +
+                                             list(missing)[:10]}})
+        async for doc in cursor:
+            names[doc["_id"]] = doc["name"]
+        color = self.getColor(user)
+        data = discord.Embed(title=choice["name"], colour=color)
+        if buy:
+            data.add_field(name="Buy", value=self.gold_to_coins(buy))
+        for ingredient, count in ingredients:
+            ing_cost, ing_recipe, _, _ = self.resolve_craft(ingredient,
+                                                            prices, now)
+            if ing_cost is None:
+                value = "Can't be bought or crafted"
+            else:
+                action = "Craft" if ing_recipe else "Buy"
+                value = "{0} for {1}".format(action, self.gold_to_coins(
+                    int(ing_cost * count)))
+            data.add_field(name="{0} {1}".format(count, names.get(ingredient, ingredient)),
+                           value=value, inline=False)
+        total = sum((self.resolve_craft(i, prices, now)[0] or 0) * c
+                    for i, c in ingredients)
+        data.description = "Crafting {0} costs {1}".format(
+            output, self.gold_to_coins(int(total)))
+        if missing:
+            data.set_footer(text="Not included in the cost: {0}".format(
+                ", ".join(str(names.get(i, i)) for i in list(missing)[:10])))
+        try:
+            await self.bot.edit_message(message, new_content=" ", embed=data)
+        except discord.HTTPException:
+            await self.bot.say("Need permission to embed links")
+
     @commands.cooldown(1, 15, BucketType.user)
     @commands.command(pass_context=True)
     async def search(self, ctx, *, item):
@@ -1767,16 +2656,7 @@ class GuildWars2:
         keydoc = await self.fetch_key(user)
         try:
             await self._check_scopes_(user, scopes)
-            key = keydoc["key"]
-            headers = self.construct_headers(key)
-            endpoint_bank = "account/bank"
-            endpoint_shared = "account/inventory"
-            endpoint_char = "characters?page=0"
-            endpoint_material = "account/materials"
-            bank = await self.call_api(endpoint_bank, headers)
-            shared = await self.call_api(endpoint_shared, headers)
-            material = await self.call_api(endpoint_material, headers)
-            characters = await self.call_api(endpoint_char, headers)
+            inventory = await self.fetch_inventory(user, keydoc)
         except APIKeyError as e:
             await self.bot.say(e)
             return
@@ -1784,60 +2664,19 @@ class GuildWars2:
             await self.bot.say("{0.mention}, API has responded with the following error: "
                                "`{1}`".format(user, e))
             return
-        item_sanitized = re.escape(item)
-        search = re.compile(item_sanitized + ".*", re.IGNORECASE)
-        cursor = self.db.items.find({"name": search})
-        number = await cursor.count()
-        if not number:
-            await self.bot.say("Your search gave me no item results, sorry. Check for typos.")
-            return
-        if number > 20:
-            await self.bot.say("Your search gave me {0} item results. Please be more specific".format(number))
+        message, choice = await self.item_menu(user, item)
+        if not choice:
             return
-        items = []
-        msg = "Which one of these interests you? Type it's number```"
-        async for item in cursor:
-            items.append(item)
-        if number != 1:
-            for c, m in enumerate(items):
-                msg += "\n{}: {} ({})".format(c, m["name"], m["rarity"])
-            msg += "```"
-            message = await self.bot.say(msg)
-            answer = await self.bot.wait_for_message(timeout=120, author=user)
-            try:
-                num = int(answer.content)
-                choice = items[num]
-            except:
-                await self.bot.edit_message(message, "That's not a number in the list")
-                return
-            try:
-                await self.bot.delete_message(answer)
-            except:
-                pass
-        else:
-            message = await self.bot.say("Searching far and wide...")
-            choice = items[0]
         output = ""
-        await self.bot.edit_message(message, "Searching far and wide...")
         results = {"bank" : 0, "shared" : 0, "material" : 0, "characters" : {}}
-        bankresults = [item["count"] for item in bank if item != None and item["id"] == choice["_id"]]
-        results["bank"] = sum(bankresults)
-        sharedresults = [item["count"] for item in shared if item != None and item["id"] == choice["_id"]]
-        results["shared"] = sum(sharedresults)
-        materialresults = [item["count"] for item in material if item != None and item["id"] == choice["_id"]]
-        results["material"] = sum(materialresults)
-        for character in characters:
-            results["characters"][character["name"]] = 0
-            bags = [bag for bag in character["bags"] if bag != None]
-            equipment = [piece for piece in character["equipment"] if piece != None]
-            for bag in bags:
-                inv = [item["count"] for item in bag["inventory"] if item != None and item["id"] == choice["_id"]]
-                results["characters"][character["name"]] += sum(inv)
-            try:
-                eqresults = [1 for piece in equipment if piece["id"] == choice["_id"]]
-                results["characters"][character["name"]] += sum(eqresults)
-            except:
-                pass
+        locations = inventory.locations(choice["_id"])
+        results["bank"] = locations.get("bank", 0)
+        results["shared"] = locations.get("shared", 0)
+        results["material"] = locations.get("material", 0)
+        for character in inventory.characters:
+            results["characters"][character] = (
+                locations.get((character, "bags"), 0) +
+                locations.get((character, "equipped"), 0))
         if results["bank"]:
             output += "BANK: Found {0}\n".format(results["bank"])
         if results["material"]:
@@ -1901,6 +2740,46 @@ class GuildWars2:
             await self.bot.say("Need permission to embed links")
 
 
+    async def item_menu(self, user, item):
+        """Lets the user pick an item matching the given name
+
+        Returns the message to edit with results and the chosen item
+        document, or (None, None) if nothing was picked.
+        """
+        item_sanitized = re.escape(item)
+        search = re.compile(item_sanitized + ".*", re.IGNORECASE)
+        cursor = self.db.items.find({"name": search})
+        number = await cursor.count()
+        if not number:
+            await self.bot.say("Your search gave me no item results, sorry. Check for typos.")
+            return None, None
+        if number > 20:
+            await self.bot.say("Your search gave me {0} item results. Please be more specific".format(number))
+            return None, None
+        items = []
+        async for doc in cursor:
+            items.append(doc)
+        if number == 1:
+            message = await self.bot.say("Searching far and wide...")
+            return message, items[0]
+        msg = "Which one of these interests you? Type it's number```"
+        for c, m in enumerate(items):
+            msg += "\n{}: {} ({})".format(c, m["name"], m["rarity"])
+        msg += "```"
+        message = await self.bot.say(msg)
+        answer = await self.bot.wait_for_message(timeout=120, author=user)
+        try:
+            choice = items[int(answer.content)]
+        except:
+            await self.bot.edit_message(message, "That's not a number in the list")
+            return None, None
+        try:
+            await self.bot.delete_message(answer)
+        except:
+            pass
+        await self.bot.edit_message(message, "Searching far and wide...")
+        return message, choice
+
     def skill_embed(self, skill):
         #Very inconsistent endpoint, playing it safe
         description = None
@@ -1975,6 +2854,27 @@ class GuildWars2:
                            "notifs\n{} servers for news "
                            "feed".format(result_servers, result_daily, result_news))
 
+    @database.command(pass_context=True, name="jobs")
+    async def db_jobs(self, ctx):
+        """Background job schedule and statistics
+        """
+        now = time.time()
+        output = []
+        for job in self.scheduler.stats():
+            if job["running"]:
+                state = "running"
+            else:
+                state = "next run in {0}".format(self.format_timedelta(
+                    datetime.timedelta(seconds=max(job["next_run"] - now, 0))))
+            output.append("{0}: {1}\n  {2} runs, {3} failed, {4} skipped. "
+                          "Avg {5:.2f}s, max {6:.2f}s".format(
+                              job["name"], state, job["runs"], job["failures"],
+                              job["skipped"], job["avg_duration"],
+                              job["max_duration"]))
+            if job["last_error"]:
+                output.append("  Last error: {0}".format(job["last_error"]))
+        await self.bot.say("```\n{0}```".format("\n".join(output)))
+
     @commands.command(pass_context=True, no_pm=True)
     @checks.serverowner_or_permissions(administrator=True)
     async def prefix(self, ctx, *prefixes):
@@ -2008,6 +2908,20 @@ class GuildWars2:
     async def rebuild_database(self):
         # Needs a lot of cleanup, but works anyway.
         start = time.time()
+        await self.bot.change_presence(game=discord.Game(name="Rebuilding API cache"),
+                                       status=discord.Status.dnd)
+        self.bot.building_database = True
+        try:
+            await self._rebuild_collections()
+        finally:
+            # Commands are ignored while building, never leave it set
+            self.bot.building_database = False
+            await self.bot.change_presence(game=discord.Game(name="$help"),
+                                           status=discord.Status.online)
+        end = time.time()
+        print("Database done! Time elapsed: {0} seconds".format(end - start))
+
+    async def _rebuild_collections(self):
         await self.db.items.drop()
         await self.db.itemstats.drop()
         await self.db.achievements.drop()
@@ -2016,9 +2930,10 @@ class GuildWars2:
         await self.db.skins.drop()
         await self.db.currencies.drop()
         await self.db.skills.drop()
-        await self.bot.change_presence(game=discord.Game(name="Rebuilding API cache"),
-                                       status=discord.Status.dnd)
-        self.bot.building_database = True
+        await self.db.pvpranks.drop()
+        await self.db.colors.drop()
+        await self.db.minis.drop()
+        await self.db.outfits.drop()
         try:
             items = await self.call_api("items")
         except Exception as e:
@@ -2137,71 +3052,595 @@ class GuildWars2:
         for item in itemgroup:
             item["_id"] = item["id"]
         await self.db.skills.insert_many(itemgroup)
-        end = time.time()
-        self.bot.building_database = False
-        await self.bot.change_presence(game=discord.Game(name="$help"),
-                                       status=discord.Status.online)
+        for collection, endpoint in SMALL_COLLECTIONS:
+            await self.sync_collection(collection, endpoint)
+        await self.load_pvp_ranks()
+        await self.load_collections()
+        await self.load_recipe_graph()
+        await self.load_wiki_index()
 
-        print("Database done! Time elapsed: {0} seconds".format(end - start))
+    def generate_professions(self):
+        """Profession metadata with parsed colors
 
-    async def _gamebuild_checker(self):
-        while self is self.bot.get_cog("GuildWars2"):
-            try:
-                if await self.update_build():
-                    channels = await self.get_channels()
-                    try:
-                        link = await self.get_patchnotes()
-                        patchnotes = "\nPatchnotes: " + link
-                    except:
-                        patchnotes = ""
-                    if channels:
-                        for channel in channels:
-                            try:
-                                await self.bot.send_message(self.bot.get_channel(channel),
-                                                            "@here Guild Wars 2 has just updated! New build: "
-                                                            "`{0}`{1}".format(self.build["id"], patchnotes))
-                            except:
-                                pass
-                    else:
-                        print(
-                            "A new build was found, but no channels to notify were found. Maybe error?")
-                    await self.rebuild_database(    )
-                await asyncio.sleep(60)
-            except Exception as e:
-                print(
-                    "Update ontifier has encountered an exception: {0}".format(e))
-                await asyncio.sleep(60)
+        Keyed by both the lowercase key and the name the API uses.
+        """
+        professions = {}
+        for key, profession in self.gamedata["professions"].items():
+            info = {"name": profession["name"], "icon": profession["icon"],
+                    "color": int(profession["color"], 0)}
+            professions[key] = professions[profession["name"]] = info
+        return professions
+
+    async def sync_collection(self, collection, endpoint):
+        itemgroup = await self.call_api("{0}?ids=all".format(endpoint))
+        for item in itemgroup:
+            item["_id"] = item["id"]
+        await self.db[collection].insert_many(itemgroup)
+
+    async def fill_missing_collections(self):
+        """Syncs the small collections that are still empty
+
+        A database built before they were added would otherwise lack
+        them until the next game build triggers a rebuild.
+        """
+        if not self.bot.building_database:
+            for collection, endpoint in SMALL_COLLECTIONS:
+                if await self.db[collection].find_one() is not None:
+                    continue
+                try:
+                    await self.sync_collection(collection, endpoint)
+                except APIError as e:
+                    print("Couldn't sync {0}: {1}".format(collection, e))
+        await self.load_pvp_ranks()
+        await self.load_collections()
+
+    async def load_pvp_ranks(self):
+        """Loads the pvp ranks sorted by their minimum rank"""
+        ranks = []
+        cursor = self.db.pvpranks.find({}, {"name": 1, "icon": 1,
+                                            "min_rank": 1}).sort("min_rank", 1)
+        async for rank in cursor:
+            ranks.append(rank)
+        self.pvp_rank_mins = [rank["min_rank"] for rank in ranks]
+        self.pvp_ranks = ranks
+
+    def find_pvp_rank(self, level):
+        """Returns the pvp rank a pvp rank level falls in, if known"""
+        index = bisect_right(self.pvp_rank_mins, level) - 1
+        return self.pvp_ranks[index] if index >= 0 else None
+
+    def generate_events(self):
+        """Builds the events reminders can be set for
+
+        Maps a lowercase key to the event's name and sorted start times in
+        seconds since midnight UTC. HoT map phases repeat every two hours.
+        A map's first phase is skipped when the window ends with a phase
+        of the same name, as it is then the tail of an occurrence started
+        in the previous window.
+        """
+        times = defaultdict(set)
+        for boss in self.boss_schedule:
+            times[boss["name"]].add(boss["seconds"])
+        for hotmap in self.gamedata["event_timers"]["maps"]:
+            phases = hotmap["phases"]
+            for index, phase in enumerate(phases):
+                if not index and phases[-1]["name"] == phase["name"]:
+                    continue
+                name = "{}: {}".format(hotmap["name"], phase["name"])
+                start = (phase["end"] - phase["duration"]) * 60
+                times[name].update(range(start, 86400, 7200))
+        return OrderedDict((name.lower(), {"name": name,
+                                           "times": sorted(times[name])})
+                           for name in sorted(times))
+
+    def check_event_times(self):
+        """Checks that map events start exactly when their phases do
+
+        Each map's two hour window is laid out minute by minute. A phase
+        starts wherever the minute before belongs to another phase, except
+        across the window's edge if both phases share a name. Returns a
+        list of problems, empty if the events match.
+        """
+        problems = []
+        for hotmap in self.gamedata["event_timers"]["maps"]:
+            minutes = [None] * 120
+            for index, phase in enumerate(hotmap["phases"]):
+                for minute in range(phase["end"] - phase["duration"],
+                                    phase["end"]):
+                    minutes[minute] = (index, phase["name"])
+            if None in minutes:
+                problems.append("{} has no phase at minute {}".format(
+                    hotmap["name"], minutes.index(None)))
                 continue
+            starts = defaultdict(list)
+            for minute, (index, name) in enumerate(minutes):
+                previous, previous_name = minutes[minute - 1]
+                if previous == index or not minute and previous_name == name:
+                    continue
+                starts[name].append(minute * 60)
+            for name, expected in starts.items():
+                key = "{}: {}".format(hotmap["name"], name).lower()
+                actual = [t for t in self.events.get(key, {}).get("times", [])
+                          if t < 7200]
+                if actual != expected:
+                    problems.append("{} starts at {}, expected {}".format(
+                        key, actual, expected))
+        return problems
+
+    def find_events(self, query):
+        query = query.lower()
+        if query in self.events:
+            return [query]
+        return [key for key in self.events if query in key]
+
+    def next_reminder(self, key, now):
+        """Returns when a reminder of minutes before an event next fires"""
+        event, minutes = key
+        target = now + minutes * 60
+        day = target - target % 86400
+        times = self.events[event]["times"]
+        index = bisect_right(times, target - day)
+        if index == len(times):
+            return day + 86400 + times[0] - minutes * 60
+        return day + times[index] - minutes * 60
+
+    def add_reminder(self, doc):
+        key = (doc["event"], doc["minutes"])
+        self.reminders[key][doc["_id"]] = doc
+        self.reminder_timers.schedule(key, self.next_reminder(key, time.time()))
+
+    async def load_reminders(self):
+        for old, new in EVENT_RENAMES.items():
+            await self.db.reminders.update_many({"event": old},
+                                                {"$set": {"event": new}})
+        async for doc in self.db.reminders.find():
+            if doc["event"] in self.events:
+                self.add_reminder(doc)
+        self.reminder_timers.start()
+
+    async def server_reminders(self, server):
+        cursor = self.db.reminders.find({"server": server.id}).sort("_id", 1)
+        docs = []
+        async for doc in cursor:
+            if doc["event"] in self.events:
+                docs.append(doc)
+        return docs
+
+    async def fire_reminders(self, key, when):
+        """Sends every reminder of an (event, minutes) pair
+
+        Channels are grouped by the role they ping, so each group is a
+        single dispatch.
+        """
+        subscriptions = self.reminders.get(key)
+        if not subscriptions:
+            self.reminders.pop(key, None)
+            return
+        self.reminder_timers.schedule(key, self.next_reminder(key, when + 1))
+        if time.time() - when > 60:
+            # Fired too late, e.g. after the loop was blocked
+            return
+        event, minutes = key
+        name = self.events[event]["name"]
+        if minutes:
+            text = "{} starts in {} minutes!".format(name, minutes)
+        else:
+            text = "{} is starting now!".format(name)
+        by_role = defaultdict(list)
+        for doc in subscriptions.values():
+            by_role[doc["role"]].append(doc["channel"])
+        await asyncio.gather(*[
+            self.dispatcher.dispatch(
+                "reminder", channels,
+                [("<@&{}> {}".format(role, text) if role else text, None)],
+                on_gone=self.remove_reminder_channels)
+            for role, channels in by_role.items()])
+
+    async def remove_reminder_channels(self, channels):
+        """Deletes the reminders of channels that were deleted"""
+        await self.db.reminders.delete_many({"channel": {"$in": channels}})
+        gone = set(channels)
+        for subscriptions in self.reminders.values():
+            for _id in [k for k, d in subscriptions.items()
+                        if d["channel"] in gone]:
+                del subscriptions[_id]
+        print("Removed reminders of {0} deleted channels".format(len(channels)))
+
+    async def load_wiki_index(self):
+        """Builds the sorted title index used by wiki_lookup"""
+        titles = set()
+        for collection in WIKI_INDEX_COLLECTIONS:
+            cursor = self.db[collection].find({}, {"name": 1, "_id": 0})
+            async for doc in cursor:
+                if doc.get("name"):
+                    titles.add(doc["name"].strip())
+        index = await self.bot.loop.run_in_executor(
+            None, sorted, ((t.lower(), t) for t in titles))
+        self.wiki_keys = [key for key, _ in index]
+        self.wiki_titles = [title for _, title in index]
+        print("Wiki index loaded with {0} titles".format(len(index)))
+
+    def wiki_lookup(self, query):
+        """Finds a wiki page link in the local title index
+
+        Exact title matches come first. Otherwise, the shortest of the
+        titles starting with the query is used.
+        """
+        query = query.lower()
+        index = bisect_left(self.wiki_keys, query)
+        title = None
+        if index < len(self.wiki_keys):
+            if self.wiki_keys[index] == query:
+                title = self.wiki_titles[index]
+            elif len(query) >= WIKI_PREFIX_MIN:
+                end = bisect_left(self.wiki_keys, query + "\uffff", index)
+                if end > index:
+                    # Ties go to the first title alphabetically
+                    title = min(self.wiki_titles[index:end], key=len)
+        self.metrics.cache("wiki_index", title is not None)
+        if title is None:
+            return None
+        return "/wiki/" + quote(title.replace(" ", "_"), safe="/:'(),!")
 
+    async def wiki_search(self, query):
+        """Returns the first wiki full-text search result link, or None
 
-    async def news_checker(self):
-        while self is self.bot.get_cog("GuildWars2"):
-            try:
-                to_post = await self.check_news()
-                if to_post:
-                    embeds = []
-                    for item in to_post:
-                        embeds.append(self.news_embed(item))
-                    await self.send_news(embeds)
-                await asyncio.sleep(300)
-            except APIError as e:
-                print(
-                    "News ontifier has encountered an exception: {0}".format(e))
-                await asyncio.sleep(300)
+        Results, empty ones included, are reused for WIKI_TTL seconds.
+        """
+        key = query.lower()
+        now = time.time()
+        cached = self.wiki_cache.get(key)
+        self.metrics.cache("wiki_search", cached is not None and
+                           now - cached[1] < WIKI_TTL)
+        if cached is not None and now - cached[1] < WIKI_TTL:
+            return cached[0]
+        url = ("http://wiki.guildwars2.com/index.php?title=Special%3ASearch"
+               "&profile=default&fulltext=Search&search={0}".format(
+                   quote(query.replace(" ", "+"), safe="+")))
+        async with self.session.get(url) as r:
+            results = await r.text()
+        link = await self.parser.run(parse_wiki_search, results)
+        self.wiki_cache[key] = (link, now)
+        return link
+
+    async def load_recipe_graph(self):
+        """Builds the in-memory recipe adjacency map from the recipes collection
+
+        Maps output item id to a list of (output count, ingredients) tuples,
+        ingredients being (item id, count) tuples.
+        """
+        graph = {}
+        cursor = self.db.recipes.find({}, {"output_item_id": 1,
+                                           "output_item_count": 1,
+                                           "ingredients": 1})
+        async for recipe in cursor:
+            ingredients = []
+            for ingredient in recipe["ingredients"]:
+                # Currencies and guild upgrades can't be priced, skip them
+                if ingredient.get("type", "Item") != "Item":
+                    continue
+                ingredients.append((ingredient.get("item_id", ingredient.get("id")),
+                                    ingredient["count"]))
+            graph.setdefault(recipe["output_item_id"], []).append(
+                (recipe["output_item_count"], tuple(ingredients)))
+        self.recipe_graph = graph
+        self.craft_memo = {}
+        print("Recipe graph loaded with {0} craftable items".format(len(graph)))
+
+    def recipe_tree(self, item_id):
+        """All item ids in the recipe tree of an item, the item included"""
+        seen = set()
+        stack = [item_id]
+        while stack:
+            current = stack.pop()
+            if current in seen:
                 continue
+            seen.add(current)
+            for _, ingredients in self.recipe_graph.get(current, []):
+                stack.extend(i for i, _ in ingredients)
+        return seen
+
+    def resolve_craft(self, item_id, prices, now):
+        """Cheapest way to obtain one unit of an item
+
+        Returns (cost, recipe, missing, craft). recipe is the (output
+        count, ingredients) tuple to craft with, or None if buying is
+        cheaper. missing holds ids in the tree that can be neither bought
+        nor crafted and are left out of the cost. craft is the (cost,
+        recipe, missing) of the cheapest recipe even when buying wins, or
+        None if the item can't be crafted. Results are memoized across
+        requests for PRICE_TTL seconds.
+        """
+        return self._resolve_craft(item_id, prices, now, frozenset())[0]
 
+    def _resolve_craft(self, item_id, prices, now, visiting):
+        """Returns resolve_craft's result and the ids of the items being
+        resolved further up that the search stopped at to break a cycle
 
+        A result cut short by such an ancestor depends on the path it was
+        reached by, so only results without any are memoized.
+        """
+        memo = self.craft_memo.get(item_id)
+        if memo and now - memo[0] < PRICE_TTL:
+            return memo[1:], frozenset()
+        buy = prices.get(item_id, (0, 0))[1] or None
+        best = None
+        cuts = set()
+        if item_id in visiting:
+            cuts.add(item_id)
+        else:
+            visiting = visiting | {item_id}
+            for recipe in self.recipe_graph.get(item_id, []):
+                output, ingredients = recipe
+                total = 0
+                missing = set()
+                for ingredient, count in ingredients:
+                    (cost, _, lacking, _), cut = self._resolve_craft(
+                        ingredient, prices, now, visiting)
+                    cuts |= cut
+                    if cost is None:
+                        missing.add(ingredient)
+                    else:
+                        total += cost * count
+                    missing |= lacking
+                candidate = (total / output, recipe, frozenset(missing))
+                # Prefer complete recipes, then the cheapest
+                if best is None or ((len(candidate[2]), candidate[0]) <
+                                    (len(best[2]), best[0])):
+                    best = candidate
+            # Cycles back to this item are complete once it is resolved
+            cuts.discard(item_id)
+        if buy is not None and (best is None or best[2] or buy <= best[0]):
+            result = (buy, None, frozenset(), best)
+        elif best is not None:
+            result = best + (best,)
+        else:
+            result = (None, None, frozenset(), None)
+        if not cuts:
+            self.craft_memo[item_id] = (now,) + result
+        return result, frozenset(cuts)
+
+    def schedule_jobs(self):
+        """Registers the background jobs and starts the scheduler"""
+        self.scheduler.add_job("build", self._gamebuild_checker,
+                               interval=60, run_at_start=True)
+        self.scheduler.add_job("news", self.news_checker, interval=300,
+                               jitter=30, run_at_start=True)
+        # Also runs at startup, to catch up on a reset missed while offline
+        self.scheduler.add_job("daily", self.daily_notifs, at=[(0, 0)],
+                               run_at_start=True)
+        self.scheduler.add_job("wvw", self.refresh_wvw, interval=WVW_INTERVAL,
+                               jitter=20, run_at_start=True)
+        self.scheduler.add_job("leaderboards", self.refresh_leaderboards,
+                               interval=LEADERBOARD_INTERVAL, jitter=60,
+                               run_at_start=True)
+        self.scheduler.add_job("watches", self.check_watches,
+                               interval=WATCH_INTERVAL, jitter=15)
+        self.scheduler.add_job("prices", self.collect_prices,
+                               interval=PRICE_HISTORY_INTERVAL, jitter=60,
+                               run_at_start=True)
+        self.scheduler.start()
 
-    async def daily_notifs(self):
-        while self is self.bot.get_cog("GuildWars2"):
+    async def _gamebuild_checker(self):
+        if await self.update_build():
+            channels = await self.subscriptions.channels("build")
             try:
-                if self.check_day():
-                    await self.send_daily_notifs()
-                await asyncio.sleep(60)
-            except Exception as e:
-                print("Daily notifier exception: {0}\nExecution will continue".format(e))
-                await asyncio.sleep(60)
-                continue
+                link = await self.get_patchnotes()
+                patchnotes = "\nPatchnotes: " + link
+            except:
+                patchnotes = ""
+            if channels:
+                message = ("@here Guild Wars 2 has just updated! New build: "
+                           "`{0}`{1}".format(self.build["id"], patchnotes))
+                await self.dispatcher.dispatch(
+                    "build", channels, [(message, None)],
+                    on_gone=lambda gone: self.disable_channels("build", gone))
+            else:
+                print(
+                    "A new build was found, but no channels to notify were found. Maybe error?")
+            await self.rebuild_database()
+
+    async def news_checker(self):
+        to_post = await self.check_news()
+        if to_post:
+            embeds = []
+            for item in to_post:
+                embeds.append(self.news_embed(item))
+            await self.send_news(embeds)
+
+    async def collect_prices(self):
+        """Appends a snapshot of every tradable item's price to the history
+
+        History is bucketed per item and UTC day, each bucket holding
+        parallel t/buy/sell arrays that snapshots are pushed onto. Prices
+        go through fetch_prices one batch at a time, so ones fetched by
+        commands moments ago are reused.
+        """
+        ids = await self.call_api("commerce/prices")
+        day = datetime.datetime.utcnow().replace(hour=0, minute=0, second=0,
+                                                 microsecond=0)
+        stamp = int(time.time())
+        for counter in range(0, len(ids), 200):
+            prices = await self.fetch_prices(ids[counter:counter + 200])
+            requests = []
+            for item_id, (buy, sell) in prices.items():
+                if not buy and not sell:
+                    # Not tradable after all
+                    continue
+                requests.append(UpdateOne(
+                    {"_id": "{0}-{1:%Y%m%d}".format(item_id, day)},
+                    {"$setOnInsert": {"item_id": item_id, "day": day},
+                     "$push": {"t": stamp, "buy": buy, "sell": sell}},
+                    upsert=True))
+            if requests:
+                await self.db.pricehistory.bulk_write(requests, ordered=False)
+            await asyncio.sleep(PRICE_HISTORY_DELAY)
+
+    async def refresh_leaderboards(self):
+        """Refreshes the leaderboard entries that are due
+
+        Every key gets an entry, new ones due right away. An entry is due
+        again LEADERBOARD_TTL seconds after a refresh, or after a backoff
+        when the refresh failed, so failing keys can't crowd out the rest
+        of the batch. The LEADERBOARD_BATCH entries due longest are
+        refreshed.
+        """
+        keys = set(await self.db.keys.distinct("_id"))
+        entries = set(await self.db.leaderboards.distinct("_id"))
+        if keys - entries:
+            await self.db.leaderboards.bulk_write(
+                [UpdateOne({"_id": user_id},
+                           {"$setOnInsert": {"updated": 0, "due": 0}},
+                           upsert=True) for user_id in keys - entries],
+                ordered=False)
+        if entries - keys:
+            await self.db.leaderboards.delete_many(
+                {"_id": {"$in": list(entries - keys)}})
+        cursor = self.db.leaderboards.find({"due": {"$lte": time.time()}},
+                                           {"_id": 1})
+        cursor = cursor.sort("due", 1).limit(LEADERBOARD_BATCH)
+        stale = []
+        async for doc in cursor:
+            stale.append(doc["_id"])
+        if not stale:
+            return
+        keydocs = []
+        async for keydoc in self.db.keys.find({"_id": {"$in": stale}}):
+            keydocs.append(keydoc)
+        results = await asyncio.gather(
+            *[self.refresh_leaderboard_entry(k) for k in keydocs],
+            return_exceptions=True)
+        failed = sum(isinstance(r, Exception) for r in results)
+        self.metrics.inc("leaderboard_refreshes_total",
+                         len(results) - failed, result="ok")
+        self.metrics.inc("leaderboard_refreshes_total", failed,
+                         result="error")
+
+    async def refresh_leaderboard_entry(self, keydoc):
+        key = keydoc["key"]
+        headers = self.construct_headers(key)
+        permissions = keydoc["permissions"]
+        now = time.time()
+        stats = {"account_name": keydoc["account_name"], "updated": now,
+                 "due": now + LEADERBOARD_TTL, "failures": 0}
+        try:
+            await self.leaderboard_budget.acquire(key)
+            account = await self.call_api("account", headers)
+            if "fractal_level" in account:
+                stats["fractal"] = account["fractal_level"]
+            if "pvp" in permissions:
+                await self.leaderboard_budget.acquire(key)
+                pvp = await self.call_api("pvp/stats", headers)
+                stats["pvp"] = pvp["pvp_rank"] + pvp["pvp_rank_rollovers"]
+            counters = self.gamedata.get("counters", {})
+            if ("li" in counters and "inventories" in permissions and
+                    "characters" in permissions):
+                # An inventory takes four calls
+                await self.leaderboard_budget.acquire(key, 4)
+                inventory = await self.fetch_inventory(
+                    discord.Object(id=keydoc["_id"]), keydoc)
+                if "wallet" in permissions:
+                    await self.leaderboard_budget.acquire(key)
+                wallet = await self.fetch_wallet(counters["li"], keydoc)
+                stats["li"] = self.count_family(counters["li"], inventory,
+                                                wallet)["total"]
+        except Exception:
+            # Revoked keys, rate limits and outages alike back off
+            entry = await self.db.leaderboards.find_one(
+                {"_id": keydoc["_id"]}, {"failures": 1})
+            failures = (entry or {}).get("failures", 0) + 1
+            delay = min(LEADERBOARD_RETRY * 2 ** (failures - 1),
+                        LEADERBOARD_MAX_RETRY)
+            await self.db.leaderboards.update_one(
+                {"_id": keydoc["_id"]},
+                {"$set": {"due": time.time() + delay, "failures": failures}})
+            raise
+        await self.db.leaderboards.update_one({"_id": keydoc["_id"]},
+                                              {"$set": stats})
+
+    async def load_collections(self):
+        """Builds the bitset catalog of every unlock collection"""
+        collections = {}
+        for name, info in COLLECTIONS.items():
+            fields = info["fields"]
+            projection = dict.fromkeys(("name",) + fields, 1)
+            docs = []
+            async for doc in self.db[info["collection"]].find({}, projection):
+                docs.append(doc)
+            collections[name] = CollectionCatalog(docs, fields)
+        self.collections = collections
+
+    async def ensure_indexes(self):
+        await self.db.pricehistory.create_index([("item_id", 1), ("day", 1)])
+        await self.db.leaderboards.create_index("due")
+        # Entries from before refreshes were scheduled by due time
+        await self.db.leaderboards.update_many(
+            {"due": {"$exists": False}}, {"$set": {"due": 0}})
+        for stat in LEADERBOARDS:
+            await self.db.leaderboards.create_index([(stat, -1)])
+
+    async def load_watches(self):
+        await self.db.tpwatches.create_index("user")
+        await self.db.tpwatches.create_index([("item_id", 1), ("price", 1)])
+        watches = PriceWatchIndex()
+        async for doc in self.db.tpwatches.find():
+            watches.add(doc)
+        self.watches = watches
+
+    async def user_watches(self, user):
+        cursor = self.db.tpwatches.find({"user": user.id}).sort("_id", 1)
+        docs = []
+        async for doc in cursor:
+            docs.append(doc)
+        return docs
+
+    async def item_names(self, ids):
+        names = {}
+        cursor = self.db.items.find({"_id": {"$in": list(set(ids))}},
+                                    {"name": 1})
+        async for doc in cursor:
+            names[doc["_id"]] = doc["name"]
+        return names
+
+    async def check_watches(self):
+        """Alerts the users whose price watches were crossed
+
+        The price of every watched item is fetched once, 200 items per
+        request, and looked up in the watch index. Watches fire once and
+        are removed.
+        """
+        if not self.watches.items:
+            return
+        prices = await self.fetch_prices(list(self.watches.items))
+        triggered = []
+        for item_id, (_, sell) in prices.items():
+            # Nothing listed at all isn't a price drop
+            if sell:
+                triggered.extend(self.watches.triggered(item_id, sell))
+        if not triggered:
+            return
+        docs = []
+        async for doc in self.db.tpwatches.find({"_id": {"$in": triggered}}):
+            docs.append(doc)
+        await self.db.tpwatches.delete_many({"_id": {"$in": triggered}})
+        names = await self.item_names(doc["item_id"] for doc in docs)
+        self.metrics.inc("price_watches_triggered_total", len(docs))
+        for doc in docs:
+            self.watches.remove(doc)
+            message = "{0} {1} {2}, it is listed at {3} now".format(
+                names.get(doc["item_id"], "An item"),
+                "dropped to" if doc["direction"] == "below" else "rose to",
+                self.gold_to_coins(doc["price"]),
+                self.gold_to_coins(prices[doc["item_id"]][1]))
+            try:
+                user = await self.bot.get_user_info(doc["user"])
+                await self.bot.send_message(user, message)
+            except discord.HTTPException:
+                pass
+
+    async def daily_notifs(self):
+        if self.check_day():
+            await self.send_daily_notifs()
 
 
     def get_changelog(self):
@@ -2209,6 +3648,40 @@ class GuildWars2:
             return f.read()
 
 
+    def count_family(self, family, inventory, wallet=None):
+        """Counts an item family from gamedata["counters"]
+
+        Components are worth `weight` each. A discount prices the first
+        `count` units at the discount weight instead, and units of the
+        components listed in `consumed_by` use up that first set. The
+        family's `currencies` are counted from wallet, a {currency id:
+        amount} dict, when given.
+        """
+        base = sum(map(inventory.count, family["base"].values()))
+        if wallet:
+            base += sum(wallet.get(c, 0)
+                        for c in family.get("currencies", {}).values())
+        counts = {}
+        for component in family["components"]:
+            counts[component["key"]] = sum(
+                map(inventory.count, component["ids"].values()))
+        components = []
+        crafted = 0
+        for component in family["components"]:
+            count = counts[component["key"]]
+            discount = component.get("discount")
+            if discount:
+                used = sum(counts[k] for k in discount.get("consumed_by", []))
+                discounted = min(count, max(discount["count"] - used, 0))
+                value = (discounted * discount["weight"] +
+                         (count - discounted) * component["weight"])
+            else:
+                value = count * component["weight"]
+            components.append((component, count, value))
+            crafted += value
+        return {"base": base, "crafted": crafted, "total": base + crafted,
+                "components": components}
+
     def gold_to_coins(self, money):
         gold, remainder = divmod(money, 10000)
         silver, copper = divmod(remainder, 100)
@@ -2220,6 +3693,14 @@ class GuildWars2:
         else:
             return "{0} gold, {1} silver and {2} copper".format(gold, silver, copper)
 
+    def parse_coins(self, text):
+        """Copper amount of a price such as "1g20s5c", or None"""
+        match = COINS_RE.match(text)
+        if match is None:
+            return None
+        gold, silver, copper = (int(x) if x else 0 for x in match.groups())
+        return gold * 10000 + silver * 100 + copper
+
     def handle_duplicates(self, upgrades):
         formatted_list = []
         for x in upgrades:
@@ -2235,9 +3716,52 @@ class GuildWars2:
         headers.update(DEFAULT_HEADERS)
         return headers
 
+    async def refresh_wvw(self):
+        """Precomputes the stats of every world from all current matches
+
+        Points per tick are summed over each match's objectives once, and
+        shared by all worlds on the same side.
+        """
+        worlds = await self.call_api("worlds?ids=all")
+        matches = await self.call_api("wvw/matches?ids=all")
+        self.worlds = {w["id"]: {"name": w["name"],
+                                 "population": w["population"]}
+                       for w in worlds}
+        self.world_ids = {w["name"].lower(): w["id"] for w in worlds}
+        per_world = {}
+        overview = []
+        for match in matches:
+            ppt = dict.fromkeys(match["scores"], 0)
+            for m in match["maps"]:
+                for objective in m["objectives"]:
+                    owner = objective["owner"].lower()
+                    if owner in ppt:
+                        ppt[owner] += objective.get("points_tick", 0)
+            colors = {}
+            for color in match["scores"]:
+                kills = match["kills"][color]
+                deaths = match["deaths"][color]
+                main = self.worlds.get(match["worlds"][color], {})
+                stats = {"match": match["id"], "color": color,
+                         "name": main.get("name", "?"),
+                         "score": match["scores"][color], "ppt": ppt[color],
+                         "victory_points": match["victory_points"][color],
+                         "kills": kills, "deaths": deaths,
+                         "kd": round(kills / deaths, 2) if deaths else kills}
+                colors[color] = stats
+                for wid in match["all_worlds"][color]:
+                    per_world[wid] = stats
+            overview.append({"id": match["id"], "colors": colors})
+        self.wvw_worlds = per_world
+        self.wvw_matches = sorted(overview, key=lambda m: tuple(
+            int(x) for x in m["id"].split("-")))
+        self.wvw_updated = time.time()
+
     async def getworldid(self, world):
         if world is None:
             return None
+        if self.world_ids:
+            return self.world_ids.get(world.lower())
         try:
             endpoint = "worlds?ids=all"
             results = await self.call_api(endpoint)
@@ -2266,45 +3790,67 @@ class GuildWars2:
 
 
     async def check_news(self):
-        last_news = self.cache["news"]
-        url = "https://www.guildwars2.com/en/feed/"
-        async with self.session.get(url) as r:
-            feed = et.fromstring(await r.text())[0]
-        to_post = []
-        if last_news:
-            for item in feed.findall("item"):
-                try:
-                    if item.find("title").text not in last_news:
-                        to_post.append({
-                        "link" : item.find("link").text,
-                        "title" : item.find("title").text,
-                        "description" : item.find("description").text.split("</p>", 1)[0]
-                        })
-                except:
-                    pass
-        self.cache["news"] = [x.find("title").text for x in feed.findall("item")]
-        dataIO.save_json('data/guildwars2/cache.json', self.cache)
-        return to_post
+        """Returns the feed items that weren't seen before
+
+        The feed is requested conditionally, so an unchanged feed is a 304
+        with no body. When nothing was seen yet, the current items are
+        only remembered, not posted.
+        """
+        headers = {}
+        if self.cache.get("news_etag"):
+            headers["If-None-Match"] = self.cache["news_etag"]
+        if self.cache.get("news_modified"):
+            headers["If-Modified-Since"] = self.cache["news_modified"]
+        async with self.session.get(NEWS_FEED, headers=headers) as r:
+            if r.status == 304:
+                return []
+            if r.status != 200:
+                raise APIConnectionError(str(r.status))
+            data = await r.read()
+            etag = r.headers.get("ETag")
+            modified = r.headers.get("Last-Modified")
+        seen = self.cache.get("news_seen", [])
+        known = set(seen)
+        items = await self.parser.run(parse_feed_items, data)
+        new = [item for item in items if item["hash"] not in known]
+        self.cache["news_etag"] = etag
+        self.cache["news_modified"] = modified
+        if not new:
+            return []
+        self.cache["news_seen"] = ([item["hash"] for item in new] +
+                                   seen)[:NEWS_SEEN_LIMIT]
+        self.cache.pop("news", None)
+        dataIO.save_json_later('data/guildwars2/cache.json', self.cache)
+        return new if seen else []
 
 
     async def call_api(self, endpoint, headers=DEFAULT_HEADERS):
         apiserv = 'https://api.guildwars2.com/v2/'
         url = apiserv + endpoint
-        async with self.session.get(url, headers=headers) as r:
-            if r.status != 200 and r.status != 206:
-                if r.status == 400:
-                    raise APIBadRequest("No ongoing transactions")
-                if r.status == 404:
-                    raise APINotFound("Not found")
-                if r.status == 403:
-                    raise APIForbidden("Access denied")
-                if r.status == 429:
-                    print (time.strftime('%a %H:%M:%S'), "Api call limit reached")
-                    raise APIConnectionError(
-                        "Requests limit has been achieved. Try again later.")
-                else:
-                    raise APIConnectionError(str(r.status))
-            results = await r.json()
+        start = time.monotonic()
+        status = "error"
+        try:
+            async with self.session.get(url, headers=headers) as r:
+                status = r.status
+                if r.status != 200 and r.status != 206:
+                    if r.status == 400:
+                        raise APIBadRequest("No ongoing transactions")
+                    if r.status == 404:
+                        raise APINotFound("Not found")
+                    if r.status == 403:
+                        raise APIForbidden("Access denied")
+                    if r.status == 429:
+                        print (time.strftime('%a %H:%M:%S'), "Api call limit reached")
+                        raise APIConnectionError(
+                            "Requests limit has been achieved. Try again later.")
+                    else:
+                        raise APIConnectionError(str(r.status))
+                results = await r.json()
+        finally:
+            self.metrics.observe("api_duration_seconds",
+                                 time.monotonic() - start,
+                                 endpoint=endpoint_template(endpoint),
+                                 status=status)
         return results
 
     def get_age(self, age):
@@ -2321,6 +3867,93 @@ class GuildWars2:
         statset = await self.db.itemstats.find_one({"_id": item})
         return statset["name"]
 
+    async def fetch_inventory(self, user, keydoc):
+        inventory = self.inventories.get(user.id)
+        now = time.time()
+        hit = inventory is not None and now - inventory.created < INVENTORY_TTL
+        self.metrics.cache("inventories", hit)
+        if hit:
+            return inventory
+        headers = self.construct_headers(keydoc["key"])
+        bank = await self.call_api("account/bank", headers)
+        materials = await self.call_api("account/materials", headers)
+        shared = await self.call_api("account/inventory", headers)
+        characters = await self.call_api("characters?page=0", headers)
+        inventory = AccountInventory(bank, materials, shared, characters)
+        # Drop expired entries while we're at it
+        self.inventories = {k: v for k, v in self.inventories.items()
+                            if now - v.created < INVENTORY_TTL}
+        self.inventories[user.id] = inventory
+        return inventory
+
+    async def fetch_wallet(self, family, keydoc):
+        """Returns {currency id: amount} if the family counts currencies
+
+        Returns None when it doesn't, or the key lacks the wallet scope.
+        """
+        if (not family.get("currencies") or
+                "wallet" not in keydoc["permissions"]):
+            return None
+        headers = self.construct_headers(keydoc["key"])
+        wallet = await self.call_api("account/wallet", headers)
+        return {c["id"]: c["value"] for c in wallet}
+
+    async def fetch_prices(self, ids):
+        """Returns {item id: (buy, sell)} for the given tradable items
+
+        Prices are cached for PRICE_TTL seconds and missing ones are
+        requested from commerce/prices, 200 ids at a time.
+        """
+        now = time.time()
+        unique = set(ids)
+        missing = [i for i in unique if i not in self.prices or
+                   now - self.prices[i][2] >= PRICE_TTL]
+        self.metrics.inc("cache_requests_total", len(unique) - len(missing),
+                         cache="prices", result="hit")
+        self.metrics.inc("cache_requests_total", len(missing),
+                         cache="prices", result="miss")
+        for counter in range(0, len(missing), 200):
+            batch = missing[counter:counter + 200]
+            endpoint = "commerce/prices?ids={0}".format(
+                ",".join(str(x) for x in batch))
+            try:
+                results = await self.call_api(endpoint)
+            except APINotFound:
+                # None of the batch is tradable
+                results = []
+            # Untradable items are remembered as worthless so they aren't
+            # requested again
+            for item_id in batch:
+                self.prices[item_id] = (0, 0, now)
+            for item in results:
+                self.prices[item["id"]] = (item["buys"]["unit_price"],
+                                           item["sells"]["unit_price"], now)
+        return {i: self.prices[i][:2] for i in ids if i in self.prices}
+
+    def value_inventory(self, inventory, prices):
+        """Values an AccountInventory per location
+
+        Returns an OrderedDict of location name: (buy value, sell value).
+        Counts and prices are laid out as flat arrays so each valuation is
+        a single multiply-and-sum over the whole account.
+        """
+        ids = [i for i in inventory.items if i in prices]
+        buys = array("q", (prices[i][0] for i in ids))
+        sells = array("q", (prices[i][1] for i in ids))
+        locations = [inventory.locations(i) for i in ids]
+        remaining = array("q", (inventory.count(i) for i in ids))
+        values = OrderedDict()
+        for name, key in (("Bank", "bank"), ("Material storage", "material"),
+                          ("Shared inventory", "shared")):
+            counts = array("q", (l.get(key, 0) for l in locations))
+            remaining = array("q", map(sub, remaining, counts))
+            values[name] = (sum(map(mul, counts, buys)),
+                            sum(map(mul, counts, sells)))
+        # Whatever isn't in account storage is on characters
+        values["Characters"] = (sum(map(mul, remaining, buys)),
+                                sum(map(mul, remaining, sells)))
+        return values
+
     async def fetch_item(self, item):
         return await self.db.items.find_one({"_id": item})
 
@@ -2331,20 +3964,6 @@ class GuildWars2:
             color = discord.Embed.Empty
         return color
 
-    async def get_channels(self):
-        try:
-            channels = []
-            cursor = self.db.settings.find(modifiers={"$snapshot": True})
-            async for server in cursor:
-                try:
-                    if server["on"]:
-                        channels.append(server["channel"])
-                except:
-                    pass
-            return channels
-        except:
-            return None
-
     async def get_announcement_channel(self, server):
         try:
             serverdoc = await self.fetch_server(server)
@@ -2368,63 +3987,130 @@ class GuildWars2:
         build = results["id"]
         if not self.build["id"] == build:
             self.build["id"] = build
-            dataIO.save_json('data/guildwars2/build.json', self.build)
+            dataIO.save_json_later('data/guildwars2/build.json', self.build)
             return True
         else:
             return False
 
     def generate_schedule(self):
-        time = datetime.datetime(1, 1, 1)
+        """Builds the daily boss schedule, sorted by UTC time
+
+        Each entry holds its start as seconds since midnight, so upcoming
+        bosses can be found with a bisect on self.boss_times.
+        """
         normal = self.gamedata["event_timers"]["bosses"]["normal"]
         hardcore = self.gamedata["event_timers"]["bosses"]["hardcore"]
         schedule = []
-        counter = 0
-        while counter < 12:
-            for boss in normal:
-                increment = datetime.timedelta(hours=boss["interval"] * counter)
-                time = (datetime.datetime(1, 1, 1, *boss["start_time"]) + increment)
-                if time.day != 1:
-                    continue
-                output = {"name" : boss["name"], "time" : str(time.time()), "waypoint" : boss["waypoint"]}
-                schedule.append(output)
-            counter += 1
+        for boss in normal:
+            hours, minutes = boss["start_time"]
+            start = hours * 3600 + minutes * 60
+            for seconds in range(start, 86400, boss["interval"] * 3600):
+                schedule.append({"name": boss["name"], "seconds": seconds,
+                                 "waypoint": boss["waypoint"]})
         for boss in hardcore:
-            for hours in boss["times"]:
-                output = {"name" : boss["name"], "time" : str(datetime.time(*hours)), "waypoint" : boss["waypoint"]}
-                schedule.append(output)
-        return sorted(schedule, key=lambda t: datetime.datetime.strptime(t["time"], "%H:%M:%S").time())
-
-
-    def get_upcoming_bosses(self, timezone=None): #TODO
-        upcoming_bosses = []
-        time = datetime.datetime.utcnow()
-        counter = 0
-        day = 0
-        done = False
-        while not done:
-            for boss in self.boss_schedule:
-                if counter == 8:
-                    done = True
-                    break
-                boss_time = datetime.datetime.strptime(boss["time"], "%H:%M:%S")
-                boss_time = boss_time.replace(year=time.year, month=time.month, day=time.day) + datetime.timedelta(days=day)
-                if time < boss_time:
-                    output = {"name" : boss["name"], "time" : str(boss_time.time()), "waypoint" : boss["waypoint"], "diff" : self.format_timedelta((boss_time - time))}
-                    upcoming_bosses.append(output)
-                    counter +=1
-            day += 1
-        return upcoming_bosses
+            for hours, minutes in boss["times"]:
+                schedule.append({"name": boss["name"],
+                                 "seconds": hours * 3600 + minutes * 60,
+                                 "waypoint": boss["waypoint"]})
+        return sorted(schedule, key=lambda boss: boss["seconds"])
 
+    def get_upcoming_bosses(self, now, limit=8):
+        """Returns the next bosses after now, in seconds since midnight UTC
 
-    def schedule_embed(self, schedule):
+        Yields (boss, seconds until it starts) pairs, wrapping around to
+        the next day past the end of the schedule.
+        """
+        index = bisect_right(self.boss_times, now)
+        total = len(self.boss_schedule)
+        for position in range(index, index + min(limit, total)):
+            boss = self.boss_schedule[position % total]
+            day = 86400 if position >= total else 0
+            yield boss, boss["seconds"] + day - now
+
+    def schedule_embed(self, offset=0):
+        """Upcoming bosses embed for a UTC offset in minutes
+
+        Embeds only change once a minute, so they are reused for every
+        request within the same minute.
+        """
+        minute = int(time.time() // 60)
+        key = (minute, offset)
+        self.metrics.cache("schedule_embeds", key in self.schedule_embeds)
+        if key in self.schedule_embeds:
+            return self.schedule_embeds[key]
+        if any(cached != minute for cached, _ in self.schedule_embeds):
+            self.schedule_embeds.clear()
+        now = minute * 60 % 86400
         data = discord.Embed()
-        for boss in schedule:
-            value = "Time: {}\nWaypoint: {}".format(boss["time"], boss["waypoint"])
-            data.add_field(name="{} in {}".format(boss["name"], boss["diff"]), value=value, inline=False)
+        for boss, diff in self.get_upcoming_bosses(now):
+            local = (boss["seconds"] + offset * 60) % 86400
+            value = "Time: {}\nWaypoint: {}".format(
+                self.format_clock(local), boss["waypoint"])
+            diff = self.format_timedelta(datetime.timedelta(seconds=diff))
+            data.add_field(name="{} in {}".format(boss["name"], diff),
+                           value=value, inline=False)
         data.set_author(name="Upcoming world bosses")
-        data.set_footer(text="All times are for UTC. Timezone support coming soon™")
+        data.set_footer(text="All times are for {}. Set your timezone with "
+                             "$et timezone".format(self.format_offset(offset)))
+        self.schedule_embeds[key] = data
         return data
 
+    def format_clock(self, seconds):
+        hours, remainder = divmod(seconds, 3600)
+        return "{:02}:{:02}".format(hours, remainder // 60)
+
+    def format_offset(self, offset):
+        if not offset:
+            return "UTC"
+        hours, minutes = divmod(abs(offset), 60)
+        sign = "+" if offset > 0 else "-"
+        return "UTC{}{:02}:{:02}".format(sign, hours, minutes)
+
+    def parse_offset(self, offset):
+        """Parses a UTC offset into minutes, or returns None if invalid"""
+        match = TIMEZONE_RE.match(offset.strip())
+        if not match:
+            return None
+        sign, hours, minutes = match.groups()
+        hours, minutes = int(hours), int(minutes or 0)
+        if hours > 14 or minutes >= 60:
+            return None
+        total = hours * 60 + minutes
+        return -total if sign == "-" else total
+
+    async def fetch_timezone(self, user, server=None):
+        """Returns the UTC offset in minutes of a user, or of their server"""
+        ids = [user.id] + ([server.id] if server is not None else [])
+        missing = [x for x in ids if x not in self.timezones]
+        if missing:
+            for x in missing:
+                self.timezones[x] = None
+            cursor = self.db.timezones.find({"_id": {"$in": missing}})
+            async for doc in cursor:
+                self.timezones[doc["_id"]] = doc["offset"]
+        for x in ids:
+            if self.timezones[x] is not None:
+                return self.timezones[x]
+        return 0
+
+    async def timezone_handler(self, target, offset):
+        if offset is None:
+            await self.db.timezones.delete_one({"_id": target})
+            self.timezones[target] = None
+            await self.bot.say("Timezone reset")
+            return
+        minutes = self.parse_offset(offset)
+        if minutes is None:
+            await self.bot.say("Invalid offset. Use something like `+2`, "
+                               "`-5:30` or `UTC+1`")
+            return
+        await self.db.timezones.update_one({"_id": target},
+                                           {"$set": {"offset": minutes}},
+                                           upsert=True)
+        self.timezones[target] = minutes
+        await self.bot.say("Timezone set to {}".format(
+            self.format_offset(minutes)))
+
 
     def format_timedelta(self, td):
         hours, remainder = divmod(td.seconds, 3600)
@@ -2439,22 +4125,14 @@ class GuildWars2:
         current = datetime.datetime.utcnow().weekday()
         if self.cache["day"] != current:
             self.cache["day"] = current
-            dataIO.save_json('data/guildwars2/cache.json', self.cache)
+            dataIO.save_json_later('data/guildwars2/cache.json', self.cache)
             return True
         else:
             return False
 
     async def send_daily_notifs(self):
         try:
-            channels = []
-            cursor = self.db.settings.find({"daily.on" : True}, modifiers={"$snapshot": True})
-            async for server in cursor:
-                try:
-                    if "channel" in server["daily"]:
-                        if server["daily"]["channel"] is not None:
-                            channels.append(server["daily"]["channel"])
-                except:
-                    pass
+            channels = await self.subscriptions.channels("daily")
             try:
                 endpoint = "achievements/daily"
                 results = await self.call_api(endpoint)
@@ -2462,11 +4140,10 @@ class GuildWars2:
                 print("Exception while sending daily notifs {0}".format(e))
                 return
             message = await self.display_all_dailies(results, True)
-            for channel in channels:
-                try:
-                    await self.bot.send_message(self.bot.get_channel(channel), "```markdown\n" + message + "```\nHave a nice day!")
-                except:
-                    pass
+            message = "```markdown\n" + message + "```\nHave a nice day!"
+            await self.dispatcher.dispatch(
+                "daily", channels, [(message, None)],
+                on_gone=lambda gone: self.disable_channels("daily", gone))
         except Exception as e:
             print ("Erorr while sending daily notifs: {0}".format(e))
             return
@@ -2474,22 +4151,10 @@ class GuildWars2:
 
     async def send_news(self, embeds):
         try:
-            channels = []
-            cursor = self.db.settings.find({"news.on" : True}, modifiers={"$snapshot": True})
-            async for server in cursor:
-                try:
-                    if "channel" in server["news"]:
-                        if server["news"]["channel"] is not None:
-                            channels.append(server["news"]["channel"])
-                except:
-                    pass
-            for chanid in channels:
-                try:
-                    channel = self.bot.get_channel(chanid)
-                    for embed in embeds:
-                        await self.bot.send_message(channel, embed=embed)
-                except:
-                    pass
+            channels = await self.subscriptions.channels("news")
+            await self.dispatcher.dispatch(
+                "news", channels, [(None, embed) for embed in embeds],
+                on_gone=lambda gone: self.disable_channels("news", gone))
         except Exception as e:
             print ("Erorr while sending news: {0}".format(e))
             return
@@ -2497,6 +4162,15 @@ class GuildWars2:
 
 
 
+    async def disable_channels(self, feed, channels):
+        """Turns a feed off for servers whose feed channel was deleted"""
+        channel_field, toggle_field = FEEDS[feed]
+        await self.db.settings.update_many({channel_field: {"$in": channels}},
+                                           {"$set": {toggle_field: False}})
+        self.subscriptions.disable_channels(feed, channels)
+        print("Disabled {0} notifications for {1} deleted "
+              "channels".format(feed, len(channels)))
+
     async def _check_scopes_(self, user, scopes):
         keydoc = await self.fetch_key(user)
         if not keydoc:
@@ -2516,9 +4190,24 @@ class GuildWars2:
         url = "https://forum-en.guildwars2.com/forum/info/updates"
         async with self.session.get(url) as r:
             results = await r.text()
-        soup = BeautifulSoup(results, 'html.parser')
-        post = soup.find(class_="arenanet topic")
-        return "https://forum-en.guildwars2.com" + post.find("a")["href"]
+        link = await self.parser.run(parse_patchnotes, results)
+        return "https://forum-en.guildwars2.com" + link
+
+    async def fetch_guild_id(self, name):
+        """Resolves a guild name to its id, reused for GUILD_ID_TTL seconds"""
+        key = name.lower()
+        cached = self.guild_ids.get(key)
+        now = time.time()
+        self.metrics.cache("guild_ids", cached is not None and
+                           now - cached[1] < GUILD_ID_TTL)
+        if cached is not None and now - cached[1] < GUILD_ID_TTL:
+            return cached[0]
+        results = await self.call_api(
+            "guild/search?name={0}".format(quote(name)))
+        if not results:
+            raise APINotFound("Not found")
+        self.guild_ids[key] = (results[0], now)
+        return results[0]
 
     async def fetch_key(self, user):
         return await self.db.keys.find_one({"_id": user.id})
@@ -2540,7 +4229,8 @@ def check_files():
     files = {
         "gamedata.json": {},
         "build.json": {"id": None},
-        "cache.json": {"day": datetime.datetime.utcnow().weekday(), "news" : []}
+        "cache.json": {"day": datetime.datetime.utcnow().weekday(), "news_seen": []},
+        "config.json": {"parser": DEFAULT_CONFIG}
     }
 
     for filename, value in files.items():
@@ -2554,7 +4244,12 @@ def setup(bot):
     check_files()
     n = GuildWars2(bot)
     loop = asyncio.get_event_loop()
-    loop.create_task(n._gamebuild_checker())
-    loop.create_task(n.daily_notifs())
-    loop.create_task(n.news_checker())
+    loop.create_task(n.ensure_indexes())
+    n.schedule_jobs()
+    loop.create_task(n.load_recipe_graph())
+    loop.create_task(n.load_wiki_index())
+    loop.create_task(n.fill_missing_collections())
+    loop.create_task(n.subscriptions.load())
+    loop.create_task(n.load_reminders())
+    loop.create_task(n.load_watches())
     bot.add_cog(n)
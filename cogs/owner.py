@@ -4,14 +4,17 @@ from cogs.utils import checks
 from __main__ import set_cog
 from .utils.dataIO import dataIO
 from .utils.chat_formatting import pagify, box
+from .utils.profiler import SamplingProfiler
 
 import importlib
 import traceback
 import logging
 import asyncio
 import threading
+import tracemalloc
 import datetime
 import glob
+import io
 import os
 import aiohttp
 
@@ -46,6 +49,8 @@ class Owner:
         self.setowner_lock = False
         self.disabled_commands = dataIO.load_json("data/red/disabled_commands.json")
         self.global_ignores = dataIO.load_json("data/red/global_ignores.json")
+        self.memory_snapshot = None
+        self.update_ignore_sets()
         self.session = aiohttp.ClientSession(loop=self.bot.loop)
 
     def __unload(self):
@@ -917,6 +922,181 @@ class Owner:
         else:
             await self.bot.say("No exception has occurred yet.")
 
+    @commands.command(pass_context=True)
+    @checks.is_owner()
+    async def metrics(self, ctx):
+        """Shows command, API, database and cache metrics
+
+        Latencies are the p50 / p95 / p99 of the latest calls, in ms"""
+        metrics = self.bot.metrics
+        msg = ""
+        sections = (("Commands", "command_duration_seconds", "command"),
+                    ("GW2 API", "api_duration_seconds", "endpoint"),
+                    ("Database", "mongo_duration_seconds", "collection"))
+        for title, name, label in sections:
+            rows = self._metric_rows(metrics.histogram_values(name), label)
+            if rows:
+                msg += "# {}\n{}\n\n".format(title, "\n".join(rows))
+        errors = metrics.counter_values("command_errors_total")
+        if errors:
+            msg += "# Errors\n"
+            for labels, value in sorted(errors.items(), key=lambda e: -e[1]):
+                msg += "{}: {}\n".format(dict(labels)["error"], value)
+            msg += "\n"
+        caches = {}
+        for labels, value in metrics.counter_values(
+                "cache_requests_total").items():
+            labels = dict(labels)
+            caches.setdefault(labels["cache"], {})[labels["result"]] = value
+        if caches:
+            msg += "# Cache hit ratio\n"
+            for cache, results in sorted(caches.items()):
+                hits, misses = results.get("hit", 0), results.get("miss", 0)
+                ratio = hits / (hits + misses) if hits + misses else 0
+                msg += "{}: {:.1%} of {}\n".format(cache, ratio, hits + misses)
+        if not msg:
+            await self.bot.say("No metrics have been recorded yet.")
+            return
+        for page in pagify(msg, ["\n\n", "\n"], shorten_by=16):
+            await self.bot.say(box(page, lang="md"))
+
+    @commands.command(pass_context=True)
+    @checks.is_owner()
+    async def looplag(self, ctx, stalls: int=0):
+        """Shows how late the event loop runs scheduled callbacks
+
+        Specify a number to also get the stacks of that many of the
+        latest stalls, where the loop was blocked"""
+        monitor = self.bot.loop_monitor
+        stats = monitor.stats()
+        msg = ("Lag over the last {samples} samples:\n"
+               "p50 {p50:.3f}s, p95 {p95:.3f}s, p99 {p99:.3f}s\n"
+               "Max since start: {max:.3f}s\n"
+               "Stalls recorded: {stalls}".format(**stats))
+        await self.bot.say(box(msg))
+        for stall in list(monitor.stalls)[-stalls:] if stalls > 0 else []:
+            when = datetime.datetime.utcfromtimestamp(stall["time"])
+            header = "Blocked {:.2f}s at {:%H:%M:%S} UTC\n".format(
+                stall["lag"], when)
+            for page in pagify(header + stall["stack"], ["\n"],
+                               shorten_by=16):
+                await self.bot.say(box(page, lang="py"))
+
+    def _metric_rows(self, values, label, limit=15):
+        rows = []
+        by_count = sorted(values.items(), key=lambda v: -v[1][0])
+        for labels, (count, p50, p95, p99) in by_count[:limit]:
+            labels = dict(labels)
+            name = labels.pop(label)
+            extra = ", ".join(str(v) for k, v in sorted(labels.items()))
+            rows.append("{} ({}) x{}: {:.0f} / {:.0f} / {:.0f}".format(
+                name, extra, count, p50 * 1000, p95 * 1000, p99 * 1000))
+        return rows
+
+    @commands.command(pass_context=True)
+    @checks.is_owner()
+    async def profile(self, ctx, seconds: int=10):
+        """Profiles the bot for some seconds and DMs you the results
+
+        The attached file has collapsed stacks, ready for flamegraph.pl
+        or speedscope. Samples are taken from every thread, and from the
+        coroutines of pending tasks."""
+        if not 1 <= seconds <= 120:
+            await self.bot.say("Profile for 1 to 120 seconds.")
+            return
+        await self.bot.say("Profiling for {} seconds...".format(seconds))
+        profiler = SamplingProfiler(self.bot.loop)
+        await profiler.run(seconds)
+        fp = io.BytesIO(profiler.collapsed().encode("utf-8"))
+        filename = "profile-{:%Y%m%d-%H%M%S}.txt".format(
+            datetime.datetime.utcnow())
+        await self.bot.send_file(ctx.message.author, fp, filename=filename,
+                                 content=box(profiler.summary()))
+
+    @commands.group(pass_context=True)
+    @checks.is_owner()
+    async def memory(self, ctx):
+        """Memory profiling and cache sizes"""
+        if ctx.invoked_subcommand is None:
+            await self.bot.send_cmd_help(ctx)
+
+    @memory.command(name="start")
+    async def memory_start(self, frames: int=1):
+        """Starts tracing allocations and takes a first snapshot
+
+        More frames give more precise tracebacks but cost more memory"""
+        if tracemalloc.is_tracing():
+            await self.bot.say("Already tracing.")
+            return
+        tracemalloc.start(frames)
+        self.memory_snapshot = await self._take_snapshot()
+        await self.bot.say("Tracing allocations. Use `memory diff` to see "
+                           "what was allocated since.")
+
+    @memory.command(name="stop")
+    async def memory_stop(self):
+        """Stops tracing allocations"""
+        tracemalloc.stop()
+        self.memory_snapshot = None
+        await self.bot.say("Stopped tracing allocations.")
+
+    @memory.command(name="diff")
+    async def memory_diff(self, limit: int=15, reset: bool=False):
+        """Shows the lines that allocated the most since the last snapshot
+
+        If reset (yes is specified), the current snapshot becomes the one
+        next diffs are compared to"""
+        if not tracemalloc.is_tracing() or self.memory_snapshot is None:
+            await self.bot.say("Not tracing. Use `memory start` first.")
+            return
+        snapshot = await self._take_snapshot()
+        stats = await self.bot.loop.run_in_executor(
+            None, snapshot.compare_to, self.memory_snapshot, "lineno")
+        if reset:
+            self.memory_snapshot = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        msg = "Traced: {:.1f} MB, peak {:.1f} MB\n\n".format(
+            current / 1024 ** 2, peak / 1024 ** 2)
+        msg += "\n".join(str(stat) for stat in stats[:limit])
+        for page in pagify(msg, ["\n"], shorten_by=16):
+            await self.bot.say(box(page))
+
+    @memory.command(name="caches")
+    async def memory_caches(self):
+        """Shows the approximate size of every cache"""
+        caches = self.bot.caches
+        sizes = caches.sizes()
+        total = sum(size for _, size, _ in sizes)
+        msg = "Total {:.1f} of {} MB budget, {} evictions\n\n".format(
+            total / 1024 ** 2, caches.budget // 1024 ** 2, caches.evictions)
+        for name, size, evictable in sizes:
+            msg += "{:<32} {:>9.1f} KB{}\n".format(
+                name, size / 1024, "" if evictable else " (kept)")
+        for page in pagify(msg, ["\n"], shorten_by=16):
+            await self.bot.say(box(page))
+
+    @memory.command(name="budget")
+    async def memory_budget(self, megabytes: int):
+        """Sets how many MB the caches may take before being evicted"""
+        if megabytes < 1:
+            await self.bot.say("The budget must be at least 1 MB.")
+            return
+        self.bot.settings.memory_budget = megabytes
+        self.bot.settings.save_settings()
+        self.bot.caches.budget = megabytes * 1024 ** 2
+        evicted = self.bot.caches.enforce()
+        msg = "Cache budget set to {} MB.".format(megabytes)
+        if evicted:
+            msg += " Evicted: {}".format(", ".join(evicted))
+        await self.bot.say(msg)
+
+    async def _take_snapshot(self):
+        snapshot = await self.bot.loop.run_in_executor(
+            None, tracemalloc.take_snapshot)
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")))
+
     def _populate_list(self, _list):
         """Used for both whitelist / blacklist
 
@@ -1050,11 +1230,17 @@ class Owner:
 
         return fmt.format(d=days, h=hours, m=minutes, s=seconds)
 
+    def update_ignore_sets(self):
+        # Checked on every message, so kept as sets next to the saved lists
+        self.blacklist = set(self.global_ignores["blacklist"])
+        self.whitelist = set(self.global_ignores["whitelist"])
+
     def save_global_ignores(self):
-        dataIO.save_json("data/red/global_ignores.json", self.global_ignores)
+        self.update_ignore_sets()
+        dataIO.save_json_later("data/red/global_ignores.json", self.global_ignores)
 
     def save_disabled_commands(self):
-        dataIO.save_json("data/red/disabled_commands.json", self.disabled_commands)
+        dataIO.save_json_later("data/red/disabled_commands.json", self.disabled_commands)
 
 
 def _import_old_data(data):
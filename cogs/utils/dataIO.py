@@ -1,17 +1,35 @@
+import atexit
 import json
 import os
 import logging
+import threading
+import time
 from random import randint
 
+# Seconds between flushes of the writes queued with save_json_later
+WRITE_BEHIND_INTERVAL = 5
+
 class InvalidFileIO(Exception):
     pass
 
 class DataIO():
     def __init__(self):
         self.logger = logging.getLogger("red")
+        self._pending = {}
+        self._flushing = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._worker = None
 
     def save_json(self, filename, data):
         """Atomically saves json file"""
+        with self._write_lock:
+            with self._lock:
+                # A queued older version must not overwrite this one later
+                self._pending.pop(filename, None)
+            return self._write_json(filename, data)
+
+    def _write_json(self, filename, data):
         rnd = randint(1000, 9999)
         path, ext = os.path.splitext(filename)
         tmp_file = "{}-{}.tmp".format(path, rnd)
@@ -27,12 +45,56 @@ class DataIO():
         os.replace(tmp_file, filename)
         return True
 
+    def save_json_later(self, filename, data):
+        """Queues a json file to be saved atomically by a worker thread
+
+        Only a compact snapshot of data is taken here, so the caller can
+        keep changing it. Saves of the same file are coalesced until the
+        next flush, which happens every WRITE_BEHIND_INTERVAL seconds and
+        at exit."""
+        snapshot = json.dumps(data)
+        with self._lock:
+            self._pending[filename] = snapshot
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._write_behind,
+                                                name="dataIO-writer",
+                                                daemon=True)
+                self._worker.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        """Writes every queued file now"""
+        with self._write_lock:
+            with self._lock:
+                self._flushing, self._pending = self._pending, {}
+            for filename, snapshot in self._flushing.items():
+                try:
+                    self._write_json(filename, json.loads(snapshot))
+                except Exception:
+                    self.logger.exception("Couldn't write queued file "
+                                          "{}".format(filename))
+            with self._lock:
+                self._flushing = {}
+
+    def _write_behind(self):
+        while True:
+            time.sleep(WRITE_BEHIND_INTERVAL)
+            self.flush()
+
     def load_json(self, filename):
         """Loads json file"""
+        with self._lock:
+            snapshot = self._pending.get(filename,
+                                         self._flushing.get(filename))
+        if snapshot is not None:
+            return json.loads(snapshot)
         return self._read_json(filename)
 
     def is_valid_json(self, filename):
         """Verifies if json file exists / is readable"""
+        with self._lock:
+            if filename in self._pending or filename in self._flushing:
+                return True
         try:
             self._read_json(filename)
             return True
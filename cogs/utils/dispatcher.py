@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+
+import aiohttp
+import discord
+
+from .metrics import percentile
+
+log = logging.getLogger("red.dispatcher")
+
+DELIVERED = "delivered"
+GONE = "gone"
+FORBIDDEN = "forbidden"
+FAILED = "failed"
+
+
+def retry_after(response):
+    """Seconds a rate limited response asks to wait before retrying"""
+    headers = response.headers
+    try:
+        if "X-RateLimit-Reset-After" in headers:
+            return float(headers["X-RateLimit-Reset-After"])
+        # The API version discord.py 0.16 uses sends milliseconds
+        return float(headers["Retry-After"]) / 1000
+    except (KeyError, ValueError):
+        return 1
+
+
+class Dispatcher:
+    """Fans messages out to many channels concurrently
+
+    At most `concurrency` channels are being delivered to at once, and all
+    sends draw from a shared token bucket refilled at `rate` per second so
+    the bot stays under Discord's global rate limit. Messages for one
+    channel share a route and are sent in order. Server errors and
+    timeouts are retried with exponential backoff and rate limited sends
+    after the wait Discord asks for. Other client errors aren't retried,
+    and channels that no longer exist are handed to the on_gone callback.
+    """
+
+    def __init__(self, bot, *, concurrency=25, rate=40, retries=3):
+        self.bot = bot
+        self.rate = rate
+        self.retries = retries
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.reports = {}
+        self._tokens = rate
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def _acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens +
+                                   (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _deliver(self, channel_id, messages, start):
+        async with self.semaphore:
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                # Could just be an unavailable server, don't disable it
+                return FAILED, None
+            for content, embed in messages:
+                for attempt in range(self.retries + 1):
+                    await self._acquire()
+                    try:
+                        await self.bot.send_message(channel, content, embed=embed)
+                        break
+                    except discord.NotFound:
+                        return GONE, None
+                    except discord.Forbidden:
+                        return FORBIDDEN, None
+                    except discord.HTTPException as e:
+                        status = e.response.status
+                        if status == 429:
+                            delay = retry_after(e.response)
+                        elif status >= 500:
+                            delay = 2 ** attempt
+                        else:
+                            # Other client errors would fail the same way again
+                            return FAILED, None
+                        if attempt == self.retries:
+                            return FAILED, None
+                        await asyncio.sleep(delay)
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        if attempt == self.retries:
+                            return FAILED, None
+                        await asyncio.sleep(2 ** attempt)
+        return DELIVERED, time.monotonic() - start
+
+    async def dispatch(self, name, channel_ids, messages, on_gone=None):
+        """Sends messages to every channel and returns a delivery report
+
+        messages is a list of (content, embed) tuples. on_gone, if given,
+        is awaited with the ids of channels that were deleted.
+        """
+        start = time.monotonic()
+        results = await asyncio.gather(
+            *[self._deliver(c, messages, start) for c in channel_ids])
+        latencies = sorted(l for _, l in results if l is not None)
+        statuses = [s for s, _ in results]
+        gone = [c for c, (s, _) in zip(channel_ids, results) if s == GONE]
+        if gone and on_gone is not None:
+            try:
+                await on_gone(gone)
+            except Exception as e:
+                log.exception("Error while disabling gone channels: "
+                              "{}".format(e))
+        report = {
+            "channels": len(channel_ids),
+            "delivered": statuses.count(DELIVERED),
+            "gone": len(gone),
+            "forbidden": statuses.count(FORBIDDEN),
+            "failed": statuses.count(FAILED),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "elapsed": time.monotonic() - start,
+            "finished": time.time()
+        }
+        self.reports[name] = report
+        log.info("{0} dispatch: {delivered}/{channels} delivered, {gone} gone, "
+                 "{forbidden} forbidden, {failed} failed. Latency p50 "
+                 "{p50:.2f}s p95 {p95:.2f}s p99 {p99:.2f}s".format(name, **report))
+        return report
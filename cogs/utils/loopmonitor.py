@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from .metrics import Histogram
+
+log = logging.getLogger("red.loopmonitor")
+
+
+class LoopMonitor:
+    """Measures event loop lag and catches the callbacks causing it
+
+    A task sleeps for `interval` seconds over and over, and the lag is
+    how late it wakes up. A watchdog thread checks that the task keeps
+    ticking; when it hasn't for `threshold` seconds past its interval,
+    the loop is blocked and the thread takes a sample of the loop
+    thread's stack, which points at the callback hogging it.
+    """
+
+    def __init__(self, loop, metrics=None, *, interval=0.5, threshold=0.25,
+                 history=20):
+        self.loop = loop
+        self.metrics = metrics
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = Histogram()
+        self.max_lag = 0
+        self.stalls = deque(maxlen=history)
+        self._tick = None
+        self._loop_thread = None
+        self._task = None
+        self._running = False
+
+    def start(self):
+        """Starts monitoring, must be called from the loop's thread"""
+        if self._running:
+            return
+        self._running = True
+        self._loop_thread = threading.get_ident()
+        self._tick = time.monotonic()
+        self._task = self.loop.create_task(self._sample())
+        threading.Thread(target=self._watchdog, name="loop-watchdog",
+                         daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _sample(self):
+        while True:
+            previous = self._tick
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._tick = time.monotonic()
+            lag = max(self._tick - start - self.interval, 0)
+            if self.stalls and self.stalls[-1]["tick"] == previous:
+                # The stall sampled by the watchdog is over, keep its length
+                self.stalls[-1]["lag"] = lag
+            self.lags.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if self.metrics is not None:
+                self.metrics.observe("loop_lag_seconds", lag)
+
+    def _watchdog(self):
+        sampled = None
+        while self._running:
+            time.sleep(self.threshold / 2)
+            tick = self._tick
+            blocked = time.monotonic() - tick - self.interval
+            if blocked < self.threshold or sampled == tick:
+                continue
+            # One sample per stall, taken while it is still going on
+            sampled = tick
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            self.stalls.append({"time": time.time(), "tick": tick,
+                                "lag": blocked, "stack": stack})
+            if self.metrics is not None:
+                self.metrics.inc("loop_stalls_total")
+            log.warning("Event loop blocked for over {:.2f}s in:\n{}"
+                        "".format(blocked, stack))
+
+    def stats(self):
+        count, p50, p95, p99 = ((self.lags.count,) +
+                                tuple(self.lags.quantiles(50, 95, 99)))
+        return {"samples": count, "p50": p50, "p95": p95, "p99": p99,
+                "max": self.max_lag, "stalls": len(self.stalls)}
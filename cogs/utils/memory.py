@@ -0,0 +1,98 @@
+import logging
+import sys
+from itertools import islice
+
+log = logging.getLogger("red.memory")
+
+# Items measured per container when estimating the size of a cache
+SAMPLE_ITEMS = 50
+
+
+def deep_sizeof(obj, depth=4):
+    """Approximate size in bytes of an object and what it contains
+
+    Containers with many items are estimated from a sample of them,
+    which keeps this cheap enough to run on the event loop.
+    """
+    size = sys.getsizeof(obj)
+    if depth == 0:
+        return size
+    if isinstance(obj, dict):
+        items = len(obj)
+        sample = list(islice(obj.items(), SAMPLE_ITEMS))
+        measured = sum(deep_sizeof(k, depth - 1) + deep_sizeof(v, depth - 1)
+                       for k, v in sample)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = len(obj)
+        sample = list(islice(obj, SAMPLE_ITEMS))
+        measured = sum(deep_sizeof(x, depth - 1) for x in sample)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return size + deep_sizeof(vars(obj), depth - 1)
+    elif hasattr(obj, "__slots__"):
+        return size + sum(deep_sizeof(getattr(obj, s), depth - 1)
+                          for s in obj.__slots__ if hasattr(obj, s))
+    else:
+        return size
+    if not sample:
+        return size
+    return size + measured * items // len(sample)
+
+
+class CacheRegistry:
+    """Keeps track of the bot's caches and how much memory they take
+
+    Each cache is registered with a function returning the object to
+    measure and, if it can be dropped, a function evicting it. When the
+    caches together exceed the budget, the largest evictable ones are
+    evicted until they fit again.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.caches = {}
+        self.evictions = 0
+
+    def register(self, name, getter, evict=None):
+        self.caches[name] = (getter, evict)
+
+    def unregister(self, prefix):
+        """Removes every cache whose name starts with prefix"""
+        for name in [n for n in self.caches if n.startswith(prefix)]:
+            del self.caches[name]
+
+    def sizes(self):
+        """Returns (name, bytes, evictable) tuples, largest first"""
+        sizes = []
+        for name, (getter, evict) in list(self.caches.items()):
+            try:
+                size = deep_sizeof(getter())
+            except Exception as e:
+                log.warning("Couldn't measure cache {}: {}".format(name, e))
+                continue
+            sizes.append((name, size, evict is not None))
+        return sorted(sizes, key=lambda s: -s[1])
+
+    def enforce(self):
+        """Evicts caches until they fit in the budget
+
+        Returns the names of the evicted caches."""
+        sizes = self.sizes()
+        total = sum(size for _, size, _ in sizes)
+        evicted = []
+        for name, size, evictable in sizes:
+            if total <= self.budget:
+                break
+            if not evictable:
+                continue
+            try:
+                self.caches[name][1]()
+            except Exception as e:
+                log.warning("Couldn't evict cache {}: {}".format(name, e))
+                continue
+            total -= size
+            evicted.append(name)
+        if evicted:
+            self.evictions += len(evicted)
+            log.warning("Caches over the {} MB budget, evicted: {}".format(
+                self.budget // 1024 ** 2, ", ".join(evicted)))
+        return evicted
@@ -0,0 +1,127 @@
+import os
+import threading
+from bisect import bisect_left
+from collections import deque
+
+# Upper bounds in seconds of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Latest observations kept per histogram to compute quantiles from
+SAMPLE_SIZE = 1024
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0
+    rank = max(int(round(pct / 100 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class Histogram:
+    """Cumulative bucket counts plus a window of recent samples"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def observe(self, value):
+        self.buckets[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantiles(self, *pcts):
+        values = sorted(self.samples)
+        return [percentile(values, pct) for pct in pcts]
+
+
+class Metrics:
+    """Counters and histograms keyed by name and labels
+
+    Safe to update from other threads, such as pymongo's monitoring
+    callbacks. render() formats everything in the Prometheus text
+    exposition format.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def cache(self, name, hit):
+        self.inc("cache_requests_total", cache=name,
+                 result="hit" if hit else "miss")
+
+    def counter_values(self, name):
+        """Returns a {labels: value} dict of a counter"""
+        with self._lock:
+            return {labels: value
+                    for (n, labels), value in self.counters.items()
+                    if n == name}
+
+    def histogram_values(self, name):
+        """Returns a {labels: (count, p50, p95, p99)} dict of a histogram"""
+        with self._lock:
+            return {labels: (h.count,) + tuple(h.quantiles(50, 95, 99))
+                    for (n, labels), h in self.histograms.items()
+                    if n == name}
+
+    def render(self):
+        lines = []
+        with self._lock:
+            family = None
+            for (name, labels), value in sorted(self.counters.items()):
+                if name != family:
+                    family = name
+                    lines.append("# TYPE {} counter".format(name))
+                lines.append("{}{} {}".format(name, _labels(labels), value))
+            for (name, labels), h in sorted(self.histograms.items(),
+                                            key=lambda i: i[0]):
+                if name != family:
+                    family = name
+                    lines.append("# TYPE {} histogram".format(name))
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), h.buckets):
+                    cumulative += count
+                    lines.append("{}_bucket{} {}".format(
+                        name, _labels(labels + (("le", str(bound)),)),
+                        cumulative))
+                lines.append("{}_sum{} {}".format(name, _labels(labels), h.sum))
+                lines.append("{}_count{} {}".format(name, _labels(labels),
+                                                    h.count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, text=None):
+        """Atomically writes the metrics for a textfile scraper to pick up"""
+        if text is None:
+            text = self.render()
+        tmp_file = "{}.tmp".format(path)
+        with open(tmp_file, encoding="utf-8", mode="w") as f:
+            f.write(text)
+        os.replace(tmp_file, path)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"'))
+                          for k, v in labels) + "}"
@@ -0,0 +1,64 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+DEFAULT_CONFIG = {"mode": "thread", "workers": 2, "max_pending": 32,
+                  "timeout": 10}
+
+
+class ParserError(Exception):
+    pass
+
+
+class ParserBusy(ParserError):
+    pass
+
+
+class ParserTimeout(ParserError):
+    pass
+
+
+class ParserPool:
+    """Runs CPU heavy parsing off the event loop
+
+    Jobs go to a thread pool, or a process pool when mode is "process"
+    to sidestep the GIL; functions and their results then have to be
+    picklable. At most `max_pending` jobs wait or run at once, further
+    ones wait up to `timeout` seconds for a slot. Every job must finish
+    within `timeout` seconds too.
+    """
+
+    def __init__(self, loop, *, mode="thread", workers=2, max_pending=32,
+                 timeout=10):
+        if mode == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        elif mode == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        else:
+            raise ValueError("Unknown parser mode {}".format(mode))
+        self.loop = loop
+        self.mode = mode
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_pending)
+
+    @classmethod
+    def from_config(cls, loop, config):
+        options = dict(DEFAULT_CONFIG)
+        options.update(config or {})
+        return cls(loop, **options)
+
+    async def run(self, func, *args):
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise ParserBusy("Too many parsing jobs are pending")
+        try:
+            future = self.loop.run_in_executor(self.executor, func, *args)
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise ParserTimeout("Parsing took longer than {} "
+                                "seconds".format(self.timeout))
+        finally:
+            self.semaphore.release()
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait)
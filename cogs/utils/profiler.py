@@ -0,0 +1,112 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+try:
+    all_tasks = asyncio.all_tasks
+    current_task = asyncio.current_task
+except AttributeError:
+    all_tasks = asyncio.Task.all_tasks
+    current_task = asyncio.Task.current_task
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return "{} ({}:{})".format(code.co_name,
+                               os.path.basename(code.co_filename),
+                               frame.f_lineno)
+
+
+def thread_stack(frame):
+    """Returns the frames of a thread stack, outermost first"""
+    stack = []
+    while frame is not None:
+        stack.append(frame_name(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def coroutine_stack(coro):
+    """Returns the frames a suspended coroutine is awaiting through"""
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(frame_name(frame))
+        coro = (getattr(coro, "cr_await", None) or
+                getattr(coro, "gi_yieldfrom", None))
+    return stack
+
+
+class SamplingProfiler:
+    """Statistical profiler for the live process
+
+    A thread samples the stack of every other thread every `interval`
+    seconds. Coroutines suspended in an await are not on any thread's
+    stack, so the tasks of the loop are sampled separately, from the
+    loop, every `task_interval` seconds. Both end up as collapsed stacks,
+    the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, loop, *, interval=0.005, task_interval=0.1):
+        self.loop = loop
+        self.interval = interval
+        self.task_interval = task_interval
+        self.stacks = Counter()
+        self.leaves = Counter()
+        self.samples = 0
+        self.task_samples = 0
+        self.loop_thread = None
+
+    def _sample_threads(self, duration):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = thread_stack(frame)
+                self.stacks[";".join(
+                    ["thread " + names.get(ident, str(ident))] + stack)] += 1
+                if ident == self.loop_thread:
+                    self.leaves[stack[-1]] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    async def _sample_tasks(self, duration):
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            current = current_task(loop=self.loop)
+            for task in all_tasks(self.loop):
+                if task is current or task.done():
+                    continue
+                stack = coroutine_stack(task._coro)
+                if stack:
+                    self.stacks[";".join(["task"] + stack)] += 1
+            self.task_samples += 1
+            await asyncio.sleep(self.task_interval)
+
+    async def run(self, duration):
+        self.loop_thread = threading.get_ident()
+        threads = self.loop.run_in_executor(None, self._sample_threads,
+                                            duration)
+        await asyncio.gather(threads, self._sample_tasks(duration))
+
+    def collapsed(self):
+        return "".join("{} {}\n".format(stack, count)
+                       for stack, count in self.stacks.most_common())
+
+    def summary(self, limit=15):
+        """Top functions by samples at the top of the loop thread's stack"""
+        lines = ["{} thread samples, {} task samples".format(
+            self.samples, self.task_samples)]
+        total = sum(self.leaves.values()) or 1
+        for name, count in self.leaves.most_common(limit):
+            lines.append("{:6.2%} {}".format(count / total, name))
+        return "\n".join(lines)
@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, in bursts of `capacity`
+
+    Tokens are reserved up front, letting the balance go negative, so
+    concurrent callers queue up in the order they asked without a lock.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def reserve(self, count=1):
+        """Takes count tokens and returns the seconds to wait for them"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= count
+        return max(-self.tokens / self.rate, 0)
+
+    @property
+    def full(self):
+        elapsed = time.monotonic() - self.last
+        return self.tokens + elapsed * self.rate >= self.capacity
+
+
+class RateBudget:
+    """Shares an API rate limit between many keys
+
+    Every call draws from a global bucket, keeping background work as a
+    whole under `rate` calls per second, and from a bucket of the key it
+    is made with, so no single key is hammered either.
+    """
+
+    def __init__(self, rate, key_rate, *, capacity=None, key_capacity=None):
+        self.total = TokenBucket(rate, capacity)
+        self.key_rate = key_rate
+        self.key_capacity = key_capacity
+        self.keys = {}
+
+    async def acquire(self, key, calls=1):
+        bucket = self.keys.get(key)
+        if bucket is None:
+            # Idle keys are back to a full bucket, forget them
+            self.keys = {k: b for k, b in self.keys.items() if not b.full}
+            bucket = self.keys[key] = TokenBucket(self.key_rate,
+                                                  self.key_capacity)
+        delay = max(self.total.reserve(calls), bucket.reserve(calls))
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,167 @@
+import asyncio
+import datetime
+import logging
+import random
+import time
+
+log = logging.getLogger("red.scheduler")
+
+
+class Job:
+    """A coroutine function run on a fixed interval or at set UTC times
+
+    Interval runs are anchored to their schedule rather than to when the
+    previous run finished, so they don't drift. Missed slots are skipped
+    instead of being run in a burst. Jitter delays each run by a random
+    amount without moving the schedule itself.
+    """
+
+    def __init__(self, name, func, *, interval=None, at=None, jitter=0,
+                 run_at_start=False):
+        if (interval is None) == (at is None):
+            raise ValueError("A job needs either an interval or run times")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.at = sorted(at) if at is not None else None
+        self.jitter = jitter
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_run = None
+        self.last_duration = None
+        self.max_duration = 0
+        self.total_duration = 0
+        self.last_error = None
+        now = time.time()
+        if run_at_start:
+            self._slot = now
+        elif interval is not None:
+            self._slot = now + interval
+        else:
+            self._slot = self._next_time(now)
+        self.next_run = self._slot
+
+    def _next_time(self, now):
+        today = datetime.datetime.utcfromtimestamp(now).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        midnight = (today - datetime.datetime(1970, 1, 1)).total_seconds()
+        for day in (0, 1):
+            for hour, minute in self.at:
+                slot = midnight + day * 86400 + hour * 3600 + minute * 60
+                if slot > now:
+                    return slot
+
+    def advance(self, now):
+        if self.interval is not None:
+            slot = self._slot + self.interval
+            if slot <= now:
+                slot += ((now - slot) // self.interval + 1) * self.interval
+        else:
+            slot = self._next_time(now)
+        self._slot = slot
+        self.next_run = slot + random.uniform(0, self.jitter)
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "next_run": self.next_run,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_run": self.last_run,
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+            "avg_duration": self.total_duration / self.runs if self.runs else 0,
+            "last_error": self.last_error
+        }
+
+
+class Scheduler:
+    """Runs every background job of a cog from a single task
+
+    A job that is still running when it comes due again is skipped, so
+    runs never overlap. Stopping the scheduler cancels the timer but lets
+    jobs in progress finish, since cancelling one halfway could leave its
+    work inconsistent; join() waits for them.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.jobs = {}
+        self._tasks = set()
+        self._timer = None
+        self._wakeup = asyncio.Event()
+
+    def add_job(self, name, func, **kwargs):
+        job = Job(name, func, **kwargs)
+        self.jobs[name] = job
+        self._wakeup.set()
+        return job
+
+    def start(self):
+        if self._timer is None:
+            self._timer = self.loop.create_task(self._run())
+
+    def stop(self):
+        """Stops starting jobs, without interrupting running ones"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def join(self):
+        """Waits for the jobs still running to finish"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def stats(self):
+        return [job.stats() for job in sorted(self.jobs.values(),
+                                              key=lambda j: j.next_run)]
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            for job in list(self.jobs.values()):
+                if job.next_run <= now:
+                    self._launch(job, now)
+            upcoming = min((j.next_run for j in self.jobs.values()),
+                           default=now + 60)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       max(upcoming - time.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def _launch(self, job, now):
+        job.advance(now)
+        if job.running:
+            job.skipped += 1
+            log.warning("Job {} is still running, skipping this "
+                        "run".format(job.name))
+            return
+        job.running = True
+        task = self.loop.create_task(self._execute(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job):
+        job.last_run = time.time()
+        start = time.monotonic()
+        try:
+            await job.func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.last_error = "{}: {}".format(type(e).__name__, e)
+            log.exception("Job {} has encountered an exception".format(job.name))
+        finally:
+            duration = time.monotonic() - start
+            job.running = False
+            job.runs += 1
+            job.last_duration = duration
+            job.total_duration += duration
+            job.max_duration = max(job.max_duration, duration)
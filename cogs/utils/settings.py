@@ -19,11 +19,15 @@ class Settings:
             "PASSWORD": None,
             "OWNER": None,
             "PREFIXES": [],
+            "MEMORY_BUDGET": 256,
             "default": {"ADMIN_ROLE": "Transistor",
                         "MOD_ROLE": "Process",
                         "PREFIXES": []}
                         }
         self._memory_only = False
+        # Bumped on every change, so caches built from the settings can
+        # tell when they are stale
+        self.revision = 0
 
         if not dataIO.is_valid_json(self.path):
             self.bot_settings = deepcopy(self.default_settings)
@@ -109,8 +113,9 @@ class Settings:
                 os.makedirs(folder)
 
     def save_settings(self):
+        self.revision += 1
         if not self._memory_only:
-            dataIO.save_json(self.path, self.bot_settings)
+            dataIO.save_json_later(self.path, self.bot_settings)
 
     def update_old_settings_v1(self):
         # This converts the old settings format
@@ -193,6 +198,15 @@ class Settings:
         assert isinstance(value, list)
         self.bot_settings["PREFIXES"] = value
 
+    @property
+    def memory_budget(self):
+        """Megabytes the bot's caches may take before being evicted"""
+        return self.bot_settings["MEMORY_BUDGET"]
+
+    @memory_budget.setter
+    def memory_budget(self, value):
+        self.bot_settings["MEMORY_BUDGET"] = value
+
     @property
     def default_admin(self):
         if "default" not in self.bot_settings:
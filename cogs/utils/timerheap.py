@@ -0,0 +1,72 @@
+import asyncio
+import heapq
+import logging
+import time
+
+log = logging.getLogger("red.timerheap")
+
+
+class TimerHeap:
+    """Fires callbacks for keys at given times from a single task
+
+    Pending timers are kept in a min-heap, so the task only ever sleeps
+    until the earliest one. Each key is scheduled at most once at a time;
+    the callback is awaited with the key and its due time and is expected
+    to schedule the key again if it should keep firing.
+    """
+
+    def __init__(self, loop, callback):
+        self.loop = loop
+        self.callback = callback
+        self.heap = []
+        self.scheduled = set()
+        self._tasks = set()
+        self._timer = None
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, key, when):
+        if key in self.scheduled:
+            return False
+        self.scheduled.add(key)
+        heapq.heappush(self.heap, (when, key))
+        if self.heap[0][1] == key:
+            self._wakeup.set()
+        return True
+
+    def start(self):
+        if self._timer is None:
+            self._timer = self.loop.create_task(self._run())
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for task in self._tasks:
+            task.cancel()
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                when, key = heapq.heappop(self.heap)
+                self.scheduled.discard(key)
+                task = self.loop.create_task(self._fire(key, when))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            timeout = self.heap[0][0] - now if self.heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, key, when):
+        try:
+            await self.callback(key, when)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("Timer {} has encountered an exception".format(key))
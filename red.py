@@ -7,6 +7,7 @@ import logging.handlers
 import traceback
 import datetime
 import subprocess
+import time
 
 try:
     from discord.ext import commands
@@ -20,8 +21,11 @@ except ImportError:
 
 from cogs.utils.settings import Settings
 from cogs.utils.dataIO import dataIO
+from cogs.utils.metrics import Metrics
+from cogs.utils.loopmonitor import LoopMonitor
+from cogs.utils.memory import CacheRegistry
 from cogs.utils.chat_formatting import inline
-from collections import Counter
+from collections import Counter, namedtuple
 from io import TextIOWrapper
 
 #
@@ -39,6 +43,16 @@ from io import TextIOWrapper
 
 description = "GW2BOT - For all your GW2 needs\nPowered by Red"
 
+# Per-server state resolved from the settings, valid for one settings
+# revision
+ServerCache = namedtuple("ServerCache", "revision role_ids prefixes")
+
+# Prometheus text file the metrics are exported to, and how often
+METRICS_PATH = "data/red/metrics.prom"
+METRICS_INTERVAL = 15
+# Seconds between checks of the caches against the memory budget
+CACHE_CHECK_INTERVAL = 300
+
 
 class Bot(commands.Bot):
     def __init__(self, *args, **kwargs):
@@ -52,7 +66,7 @@ class Bot(commands.Bot):
             Requires a Bot instance and a Message object to be
             passed as arguments.
             """
-            return bot.settings.get_prefixes(message.server)
+            return bot.server_cache(message.server).prefixes
 
         self.counter = Counter()
         self.uptime = datetime.datetime.utcnow()  # Refreshed before login
@@ -64,6 +78,9 @@ class Bot(commands.Bot):
         self.logger = set_logger(self)
         self._last_exception = None
         self.oauth_url = ""
+        self._server_cache = {}
+        self.metrics = Metrics()
+        self._invocations = {}
         if 'self_bot' in kwargs:
             self.settings.self_bot = kwargs['self_bot']
         else:
@@ -71,6 +88,11 @@ class Bot(commands.Bot):
             if self.settings.self_bot:
                 kwargs['pm_help'] = False
         super().__init__(*args, command_prefix=prefix_manager, **kwargs)
+        self.loop_monitor = LoopMonitor(self.loop, self.metrics)
+        self.caches = CacheRegistry(self.settings.memory_budget * 1024 ** 2)
+        self.caches.register("settings", lambda: self.settings.bot_settings)
+        self.caches.register("cooldowns", self._cooldown_caches,
+                             self._evict_cooldowns)
 
     async def send_message(self, *args, **kwargs):
         if self._message_modifiers:
@@ -92,6 +114,35 @@ class Bot(commands.Bot):
 
         return await super().send_message(*args, **kwargs)
 
+    async def process_commands(self, message):
+        """Times commands from start to finish
+
+        Listeners run as separate tasks, so timing from on_command would
+        start late and miss whatever a command does before it first
+        awaits. The handle_ hooks below are called inline instead.
+        """
+        started = time.monotonic()
+        failed = False
+        try:
+            await super().process_commands(message)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            ctx = self._invocations.pop(message.id, None)
+            if ctx is not None:
+                failed = failed or getattr(ctx, "failed", False)
+                self.metrics.observe("command_duration_seconds",
+                                     time.monotonic() - started,
+                                     command=ctx.command.qualified_name,
+                                     status="error" if failed else "ok")
+
+    def handle_command(self, command, ctx):
+        self._invocations[ctx.message.id] = ctx
+
+    def handle_command_error(self, error, ctx):
+        ctx.failed = True
+
     async def shutdown(self, *, restart=False):
         """Shut down"""
         self._shutdown_mode = not restart
@@ -138,6 +189,51 @@ class Bot(commands.Bot):
             for page in pages:
                 await self.send_message(ctx.message.channel, page)
 
+    def server_cache(self, server):
+        """
+        Returns the admin and mod role ids and the prefixes of a server.
+
+        They are resolved once per settings revision, and dropped when
+        the server or its roles change.
+        """
+        key = server.id if server is not None else None
+        cache = self._server_cache.get(key)
+        if cache is not None and cache.revision == self.settings.revision:
+            return cache
+        prefixes = tuple(self.settings.get_prefixes(server))
+        if server is not None:
+            names = (self.settings.get_server_admin(server),
+                     self.settings.get_server_mod(server))
+            role_ids = frozenset(r.id for r in server.roles if r.name in names)
+        else:
+            role_ids = frozenset()
+        cache = ServerCache(self.settings.revision, role_ids, prefixes)
+        self._server_cache[key] = cache
+        return cache
+
+    def _cooldown_mappings(self):
+        seen = set()
+        pending = list(self.commands.values())
+        while pending:
+            command = pending.pop()
+            if id(command) in seen:
+                continue
+            seen.add(id(command))
+            pending.extend(getattr(command, "commands", {}).values())
+            if getattr(command._buckets, "_cooldown", None) is not None:
+                yield command._buckets
+
+    def _cooldown_caches(self):
+        return [mapping._cache for mapping in self._cooldown_mappings()]
+
+    def _evict_cooldowns(self):
+        # Only buckets whose cooldown has expired are dropped
+        for mapping in self._cooldown_mappings():
+            mapping._verify_cache_integrity()
+
+    def invalidate_server_cache(self, server):
+        self._server_cache.pop(server.id, None)
+
     def user_allowed(self, message):
         author = message.author
 
@@ -151,28 +247,22 @@ class Bot(commands.Bot):
             return self.settings.self_bot
 
         mod_cog = self.get_cog('Mod')
-        global_ignores = self.get_cog('Owner').global_ignores
+        owner_cog = self.get_cog('Owner')
 
         if self.settings.owner == author.id:
             return True
 
-        if author.id in global_ignores["blacklist"]:
+        if author.id in owner_cog.blacklist:
             return False
 
-        if global_ignores["whitelist"]:
-            if author.id not in global_ignores["whitelist"]:
+        if owner_cog.whitelist:
+            if author.id not in owner_cog.whitelist:
                 return False
 
         if not message.channel.is_private:
-            server = message.server
-            names = (self.settings.get_server_admin(
-                server), self.settings.get_server_mod(server))
-            results = map(
-                lambda name: discord.utils.get(author.roles, name=name),
-                names)
-            for r in results:
-                if r is not None:
-                    return True
+            role_ids = self.server_cache(message.server).role_ids
+            if role_ids and any(r.id in role_ids for r in author.roles):
+                return True
 
         if mod_cog is not None:
             if not message.channel.is_private:
@@ -332,6 +422,26 @@ def initialize(bot_class=Bot, formatter_class=Formatter):
 
         await bot.get_cog('Owner').disable_commands()
 
+    @bot.event
+    async def on_server_update(before, after):
+        bot.invalidate_server_cache(after)
+
+    @bot.event
+    async def on_server_remove(server):
+        bot.invalidate_server_cache(server)
+
+    @bot.event
+    async def on_server_role_create(role):
+        bot.invalidate_server_cache(role.server)
+
+    @bot.event
+    async def on_server_role_delete(role):
+        bot.invalidate_server_cache(role.server)
+
+    @bot.event
+    async def on_server_role_update(before, after):
+        bot.invalidate_server_cache(after.server)
+
     @bot.event
     async def on_resumed():
         bot.counter["session_resumed"] += 1
@@ -343,12 +453,17 @@ def initialize(bot_class=Bot, formatter_class=Formatter):
     @bot.event
     async def on_message(message):
         bot.counter["messages_read"] += 1
+        prefixes = bot.server_cache(message.server).prefixes
+        if not message.content.startswith(prefixes):
+            return
         if bot.user_allowed(message):
             await bot.process_commands(message)
 
     @bot.event
     async def on_command_error(error, ctx):
         channel = ctx.message.channel
+        error_class = type(getattr(error, "original", error)).__name__
+        bot.metrics.inc("command_errors_total", error=error_class)
         if isinstance(error, commands.MissingRequiredArgument):
             await bot.send_cmd_help(ctx)
         elif isinstance(error, commands.BadArgument):
@@ -578,6 +693,22 @@ def load_cogs(bot):
         print("\nFailed to load: {}\n".format(" ".join(failed)))
 
 
+async def export_metrics(bot):
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        try:
+            await bot.loop.run_in_executor(None, bot.metrics.write,
+                                           METRICS_PATH, bot.metrics.render())
+        except OSError as e:
+            bot.logger.error("Couldn't export metrics: {}".format(e))
+
+
+async def check_caches(bot):
+    while True:
+        await asyncio.sleep(CACHE_CHECK_INTERVAL)
+        bot.caches.enforce()
+
+
 def main(bot):
     check_folders()
     if not bot.settings.no_prompt:
@@ -591,6 +722,9 @@ def main(bot):
 
     print("Logging into Discord...")
     bot.uptime = datetime.datetime.utcnow()
+    bot.loop.create_task(export_metrics(bot))
+    bot.loop_monitor.start()
+    bot.loop.create_task(check_caches(bot))
 
     if bot.settings.login_credentials:
         yield from bot.login(*bot.settings.login_credentials,
@@ -632,6 +766,7 @@ if __name__ == '__main__':
                              exc_info=e)
         loop.run_until_complete(bot.logout())
     finally:
+        dataIO.flush()
         loop.close()
         if bot._shutdown_mode is True:
             exit(0)